@@ -11,6 +11,7 @@
 
 import re
 import sys
+import time
 
 #-------------------------------------------------------------------------------
 # Constants
@@ -24,10 +25,9 @@ BLANK_SPACE = ' '
 DOUBLE_SPACE = '  '
 DOUBLE_QUOTE = '"'
 NEWLINE = '\n'
+CRLF = '\r\n'
 TAB = '\t'
 
-LINE_ENDING_REGEX = re.compile(r"\r?\n")
-
 CLOSE_PARENS = frozenset(['}', ')', ']'])
 OPEN_PARENS = frozenset(['{', '(', '['])
 WHITESPACE = frozenset([NEWLINE, BLANK_SPACE, TAB])
@@ -44,6 +44,49 @@ MATCH_PAREN = {
 # toggle this to check the asserts during development
 RUN_ASSERTS = False
 
+#-------------------------------------------------------------------------------
+# Dialects
+#-------------------------------------------------------------------------------
+
+# Reader syntax that differs between Lisps. Each profile is compiled once into
+# the tables the scanner consumes (see `Dialect` below).
+#
+#   parens       - pairs of open-paren and close-paren characters
+#   comment      - line comment character (the `comment` option overrides it)
+#   blockComment - open and close delimiters of nestable block comments
+#   longString   - fence character of raw strings, which are opened by a run of
+#                  any number of fence characters and closed by the same run
+#                  (ie: Janet's ``long `string` ``)
+
+DEFAULT_DIALECT = 'clojure'
+
+DIALECT_PROFILES = {
+    'clojure': {
+        'parens': ['()', '[]', '{}'],
+        'comment': ';',
+        'blockComment': None,
+        'longString': None,
+    },
+    'racket': {
+        'parens': ['()', '[]', '{}'],
+        'comment': ';',
+        'blockComment': ('#|', '|#'),
+        'longString': None,
+    },
+    'janet': {
+        'parens': ['()', '[]', '{}'],
+        'comment': '#',
+        'blockComment': None,
+        'longString': '`',
+    },
+    'lfe': {
+        'parens': ['()', '[]', '{}'],
+        'comment': ';',
+        'blockComment': ('#|', '|#'),
+        'longString': None,
+    },
+}
+
 #-------------------------------------------------------------------------------
 # Options Structure
 #-------------------------------------------------------------------------------
@@ -52,8 +95,10 @@ def transformChange(change):
     if not change:
         return None
 
-    newLines = re.split(LINE_ENDING_REGEX, change['newText'])
-    oldLines = re.split(LINE_ENDING_REGEX, change['oldText'])
+    # NOTE: a "\r" before a "\n" stays on the line before, which does not
+    #       matter here: we only use the number of lines and the last line
+    newLines = change['newText'].split(NEWLINE)
+    oldLines = change['oldText'].split(NEWLINE)
 
     # single line case:
     #    (defn foo| [])
@@ -89,6 +134,56 @@ def transformChange(change):
         'lookupX': newEndX
     }
 
+class Options(object):
+    """
+    Parsed options. The public API functions accept an Options in place of an
+    options dict, so that many texts can share one parse (see `batch`).
+    """
+    __slots__ = (
+        'cursorX', 'cursorLine', 'prevCursorX', 'prevCursorLine',
+        'selectionStartLine', 'changes', 'partialResult', 'forceBalance',
+        'returnParens', 'dialect', 'comment')
+
+    def __init__(self, options=None):
+        self.cursorX = None
+        self.cursorLine = None
+        self.prevCursorX = None
+        self.prevCursorLine = None
+        self.selectionStartLine = None
+        self.changes = None
+        self.partialResult = False
+        self.forceBalance = False
+        self.returnParens = False
+        self.dialect = DIALECTS[DEFAULT_DIALECT]
+        self.comment = None
+
+        if isinstance(options, dict):
+            if 'cursorX' in options:
+                self.cursorX = options['cursorX']
+            if 'cursorLine' in options:
+                self.cursorLine = options['cursorLine']
+            if 'prevCursorX' in options:
+                self.prevCursorX = options['prevCursorX']
+            if 'prevCursorLine' in options:
+                self.prevCursorLine = options['prevCursorLine']
+            if 'selectionStartLine' in options:
+                self.selectionStartLine = options['selectionStartLine']
+            if 'changes' in options:
+                self.changes = transformChanges(options['changes'])
+            if 'partialResult' in options:
+                self.partialResult = options['partialResult']
+            if 'forceBalance' in options:
+                self.forceBalance = options['forceBalance']
+            if 'returnParens' in options:
+                self.returnParens = options['returnParens']
+            if 'dialect' in options:
+                self.dialect = getDialect(options['dialect'])
+            if 'comment' in options:
+                self.comment = options['comment']
+
+        if self.comment is None:
+            self.comment = self.dialect.comment
+
 def transformChanges(changes):
     if len(changes) == 0:
         return None
@@ -138,9 +233,9 @@ class Result:
     __slots__ = (
         'mode', 'smart',
         'origText', 'origCursorX', 'origCursorLine',
-        'inputLines',
+        'inputLines', 'lineEnding',
         'inputLineNo', 'inputX',
-        'lines', 'lineNo', 'ch', 'x', 'indentX',
+        'changedLines', 'lineCount', 'lineNo', 'ch', 'x', 'indentX',
         'parenStack',
         'tabStops', 'parenTrail',
         'parenTrails',
@@ -154,7 +249,8 @@ class Result:
         'forceBalance', 'maxIndent', 'indentDelta', 'trackingArgTabStop',
         'error',
         'errorPosCache',
-        'comment')
+        'comment',
+        'dialect', 'strClose', 'blockCommentDepth', 'delimiterRest')
 
     def __str__(self):
         return ('Result {' + 'mode: ' + str(self.mode) + '\n\t'
@@ -163,9 +259,11 @@ class Result:
                 'origCursorX: ' + str(self.origCursorX) + '\n\t'
                 'origCursorLine: ' + str(self.origCursorLine) + '\n\t'
                 'inputLines: ' + str(self.inputLines) + '\n\t'
+                'lineEnding: ' + repr(self.lineEnding) + '\n\t'
                 'inputLineNo: ' + str(self.inputLineNo) + '\n\t'
                 'inputX: ' + str(self.inputX) + '\n\t'
-                'lines: ' + str(self.lines) + '\n\t'
+                'changedLines: ' + str(self.changedLines) + '\n\t'
+                'lineCount: ' + str(self.lineCount) + '\n\t'
                 'lineNo: ' + str(self.lineNo) + '\n\t'
                 'ch: ' + str(self.ch) + '\n\t'
                 'x: ' + str(self.x) + '\n\t'
@@ -199,7 +297,11 @@ class Result:
                 'trackingArgTabStop: ' + str(self.trackingArgTabStop) + '\n\t'
                 'error: ' + str(self.error) + '\n\t'
                 'errorPosCache: ' + str(self.errorPosCache) + '\n\t'
-                'comment: ' + str(self.comment) + '\n\t}')
+                'comment: ' + str(self.comment) + '\n\t'
+                'dialect: ' + str(self.dialect.name) + '\n\t'
+                'strClose: ' + str(self.strClose) + '\n\t'
+                'blockCommentDepth: ' + str(self.blockCommentDepth) + '\n\t'
+                'delimiterRest: ' + str(self.delimiterRest) + '\n\t}')
 
     def __init__(self, text, options, mode, smart):
         """Constructs a dictionary of the initial state."""
@@ -213,12 +315,16 @@ class Result:
         self.origCursorLine = None      # [integer] - original cursorLine option
 
                                         # [string array] - input lines that we process line-by-line char-by-char
-        self.inputLines = re.split(LINE_ENDING_REGEX, text)
+                                        # [string or string array] - the ending of every input line, or of each
+                                        #                            one when they are mixed (see `splitLines`)
+        self.inputLines, self.lineEnding = splitLines(text)
 
         self.inputLineNo = -1           # [integer] - the current input line number
         self.inputX = -1                # [integer] - the current input x position of the current character (ch)
 
-        self.lines = []                 # [string array] - output lines (with corrected parens or indentation)
+        self.changedLines = {}          # [dict] - output lines (with corrected parens or indentation) that differ
+                                        #          from their input line, by line number
+        self.lineCount = 0              # [integer] - number of output lines so far; the others are the input lines
         self.lineNo = -1                # [integer] - output line number we are on
         self.ch = ''                    # [string] - character we are processing (can be changed to indicate a replacement)
         self.x = 0                      # [integer] - output x position of the current character (ch)
@@ -252,6 +358,9 @@ class Result:
         self.isEscaping = False         # [boolean] - indicates if the next character will be escaped (e.g. `\c`).  This may be inside string comment or code.
         self.isEscaped = False          # [boolean] - indicates if the current character is escaped (e.g. `\c`).  This may be inside string comment or code.
         self.isInStr = False            # [boolean] - indicates if we are currently inside a string
+        self.strClose = DOUBLE_QUOTE    # [string] - delimiter that closes the current string (or block comment)
+        self.blockCommentDepth = 0      # [integer] - nesting depth of the current block comment
+        self.delimiterRest = 0          # [integer] - remaining characters of a multi-character delimiter (ie: `|#`)
         self.isInComment = False        # [boolean] - indicates if we are currently inside a comment
         self.commentX = None            # [integer] - x position of the start of comment on current line (if any)
 
@@ -279,6 +388,7 @@ class Result:
                                         #    (We create the tabStop when the change from 2->0 happens.)
                                         #
 
+        self.dialect = DIALECTS[DEFAULT_DIALECT] # [Dialect] - reader tables of the Lisp dialect
         self.comment = ';'              # [string] default to semicolon as comment character
         self.error = {                  # if 'success' is False, return this error to the user
             'name': None,               # [string] - Parinfer's unique name for this error
@@ -293,29 +403,21 @@ class Result:
         }
         self.errorPosCache = {}         # [object] - maps error name to a potential error position
 
-        if isinstance(options, dict):
-            if 'cursorX' in options:
-                self.cursorX = options['cursorX']
-                self.origCursorX = options['cursorX']
-            if 'cursorLine' in options:
-                self.cursorLine = options['cursorLine']
-                self.origCursorLine = options['cursorLine']
-            if 'prevCursorX' in options:
-                self.prevCursorX = options['prevCursorX']
-            if 'prevCursorLine' in options:
-                self.prevCursorLine = options['prevCursorLine']
-            if 'selectionStartLine' in options:
-                self.selectionStartLine = options['selectionStartLine']
-            if 'changes' in options:
-                self.changes = transformChanges(options['changes'])
-            if 'partialResult' in options:
-                self.partialResult = options['partialResult']
-            if 'forceBalance' in options:
-                self.forceBalance = options['forceBalance']
-            if 'returnParens' in options:
-                self.returnParens = options['returnParens']
-            if 'comment' in options:
-                self.comment = options['comment']
+        if not isinstance(options, Options):
+            options = Options(options)
+        self.cursorX = options.cursorX
+        self.origCursorX = options.cursorX
+        self.cursorLine = options.cursorLine
+        self.origCursorLine = options.cursorLine
+        self.prevCursorX = options.prevCursorX
+        self.prevCursorLine = options.prevCursorLine
+        self.selectionStartLine = options.selectionStartLine
+        self.changes = options.changes
+        self.partialResult = options.partialResult
+        self.forceBalance = options.forceBalance
+        self.returnParens = options.returnParens
+        self.dialect = options.dialect
+        self.comment = options.comment
 
 #-------------------------------------------------------------------------------
 # Possible Errors
@@ -409,13 +511,53 @@ if RUN_ASSERTS:
     assert replaceWithinString('aaa', 0, 1, 'b') == 'baa'
     assert replaceWithinString('aaa', 0, 2, 'b') == 'ba'
 
-def getLineEnding(text):
-    # NOTE: We assume that if the CR char "\r" is used anywhere,
-    #       then we should use CRLF line-endings after every line.
-    i = text.find("\r")
-    if i != -1:
-        return "\r\n"
-    return "\n"
+#-------------------------------------------------------------------------------
+# Line endings
+#-------------------------------------------------------------------------------
+
+def splitLines(text):
+    """
+    Splits text into lines at "\n" and "\r\n". Returns (lines, lineEnding),
+    where lineEnding is the ending of every line, or a list with the ending of
+    each line (but the last) when they are mixed.
+    """
+    if "\r" not in text:
+        return text.split(NEWLINE), NEWLINE
+    if text.count(CRLF) == text.count(NEWLINE):
+        return text.split(CRLF), CRLF
+
+    lines = text.split(NEWLINE)
+    lineEndings = []
+    for i in range(len(lines) - 1):
+        line = lines[i]
+        if line.endswith("\r"):
+            lines[i] = line[:-1]
+            lineEndings.append(CRLF)
+        else:
+            lineEndings.append(NEWLINE)
+    if CRLF not in lineEndings:
+        # the "\r"s are all inside lines
+        return lines, NEWLINE
+    return lines, lineEndings
+
+def joinLines(lines, lineEnding):
+    if not isinstance(lineEnding, list):
+        return lineEnding.join(lines)
+    if len(lines) == 0:
+        return ''
+    parts = []
+    for line, ending in zip(lines, lineEnding[:len(lines) - 1]):
+        parts.append(line)
+        parts.append(ending)
+    parts.append(lines[-1])
+    return ''.join(parts)
+
+if RUN_ASSERTS:
+    assert splitLines('a\nb') == (['a', 'b'], '\n')
+    assert splitLines('a\r\nb\r\n') == (['a', 'b', ''], '\r\n')
+    assert splitLines('a\rb\nc') == (['a\rb', 'c'], '\n')
+    assert splitLines('a\r\nb\nc') == (['a', 'b', 'c'], ['\r\n', '\n'])
+    assert joinLines(['a', 'b', 'c'], ['\r\n', '\n']) == 'a\r\nb\nc'
 
 #-------------------------------------------------------------------------------
 # Line Operations
@@ -437,10 +579,14 @@ def shiftCursorOnEdit(result, lineNo, start, end, replace):
             isCursorAffected(result, start, end)):
         result.cursorX += dx
 
+# Output lines share the input line strings until they are changed.
+def getLine(result, lineNo):
+    return result.changedLines.get(lineNo, result.inputLines[lineNo])
+
 def replaceWithinLine(result, lineNo, start, end, replace):
-    line = result.lines[lineNo]
+    line = getLine(result, lineNo)
     newLine = replaceWithinString(line, start, end, replace)
-    result.lines[lineNo] = newLine
+    result.changedLines[lineNo] = newLine
 
     shiftCursorOnEdit(result, lineNo, start, end, replace)
 
@@ -512,10 +658,10 @@ if RUN_ASSERTS:
 # Questions about characters
 #-------------------------------------------------------------------------------
 
-def isValidCloseParen(parenStack, ch):
+def isValidCloseParen(parenStack, ch, matchParen):
     if len(parenStack) == 0:
         return False
-    return peek(parenStack, 0).ch == MATCH_PAREN[ch]
+    return peek(parenStack, 0).ch == matchParen[ch]
 
 # def isWhitespace(result):
 #     return not result.isEscaped and result.ch in WHITESPACE
@@ -523,7 +669,7 @@ def isValidCloseParen(parenStack, ch):
 # can this be the last code character of a list?
 def isClosable(result):
     ch = result.ch
-    closer = ch in CLOSE_PARENS and not result.isEscaped
+    closer = ch in result.dialect.closeParens and not result.isEscaped
     # closer = ch in ('}', ')', ']') and not result.isEscaped
     # return result.isInCode and not isWhitespace(result) and ch != '' and not closer
     return result.isInCode and (result.isEscaped or ch not in WHITESPACE) and ch != '' and not closer
@@ -571,7 +717,7 @@ def trackArgTabStop(result, state):
 
 class Opener(object):
     __slots__ = ('self', 'inputLineNo', 'inputX', 'lineNo', 'x', 'ch', 'indentDelta',
-                 'maxChildIndent', 'argX', 'children', 'closer')
+                 'maxChildIndent', 'argX', 'children', 'closer', 'sortedStack')
     def __init__(self, inputLineNo, inputX, lineNo, x, ch, indentDelta, maxChildIndent):
         super(Opener, self).__init__()
         self.inputLineNo = inputLineNo
@@ -584,6 +730,7 @@ class Opener(object):
         self.argX = None
         self.children = None
         self.closer = None
+        self.sortedStack = False    # the openers below this one (and it) have increasing x and no indentDelta
 
     def __str__(self):
         return ("{ inputLineNo: " + str(self.inputLineNo)
@@ -607,6 +754,12 @@ def onOpenParen(result):
             sys.maxsize,
         )
 
+        # openers only leave and rejoin the stack from the top, so the ones
+        # below this opener stay the ones that are below it now
+        parent = peek(result.parenStack, 0)
+        opener.sortedStack = result.indentDelta == 0 and (
+            parent is None or (parent.sortedStack and parent.x <= opener.x))
+
         if result.returnParens:
             opener.children = []
             opener.closer = {
@@ -666,7 +819,7 @@ def onUnmatchedCloseParen(result):
 
 def onCloseParen(result):
     if result.isInCode:
-        if isValidCloseParen(result.parenStack, result.ch):
+        if isValidCloseParen(result.parenStack, result.ch, result.dialect.matchParen):
             onMatchedCloseParen(result)
         else:
             onUnmatchedCloseParen(result)
@@ -687,18 +840,57 @@ def onNewline(result):
 
 def onQuote(result):
     if result.isInStr:
-        result.isInStr = False
+        if result.strClose == DOUBLE_QUOTE:
+            result.isInStr = False
     elif result.isInComment:
         result.quoteDanger = not result.quoteDanger
         if result.quoteDanger:
             cacheErrorPos(result, ERROR_QUOTE_DANGER)
     else:
         result.isInStr = True
+        result.strClose = DOUBLE_QUOTE
         cacheErrorPos(result, ERROR_UNCLOSED_QUOTE)
 
 def onBackslash(result):
+    # long strings and block comments do not have escapes
+    if result.isInStr and result.strClose != DOUBLE_QUOTE:
+        return
     result.isEscaping = True
 
+def isAtDelimiter(result, delimiter):
+    return result.inputLines[result.inputLineNo].startswith(delimiter, result.inputX)
+
+def onBlockCommentDelimiter(result):
+    dialect = result.dialect
+    inBlockComment = result.isInStr and result.strClose == dialect.blockCommentClose
+    if inBlockComment and isAtDelimiter(result, dialect.blockCommentClose):
+        result.blockCommentDepth -= 1
+        if result.blockCommentDepth == 0:
+            result.isInStr = False
+        result.delimiterRest = len(dialect.blockCommentClose) - 1
+    elif (result.isInCode or inBlockComment) and isAtDelimiter(result, dialect.blockCommentOpen):
+        if result.isInCode:
+            result.isInStr = True
+            result.strClose = dialect.blockCommentClose
+            cacheErrorPos(result, ERROR_UNCLOSED_QUOTE)
+        result.blockCommentDepth += 1
+        result.delimiterRest = len(dialect.blockCommentOpen) - 1
+
+def onLongStringFence(result):
+    if result.isInCode:
+        line = result.inputLines[result.inputLineNo]
+        fence = result.ch
+        endX = result.inputX + 1
+        while endX < len(line) and line[endX] == fence:
+            endX += 1
+        result.isInStr = True
+        result.strClose = line[result.inputX:endX]
+        result.delimiterRest = len(result.strClose) - 1
+        cacheErrorPos(result, ERROR_UNCLOSED_QUOTE)
+    elif result.isInStr and result.strClose[0] == result.ch and isAtDelimiter(result, result.strClose):
+        result.isInStr = False
+        result.delimiterRest = len(result.strClose) - 1
+
 def afterBackslash(result):
     result.isEscaping = False
     result.isEscaped = True
@@ -712,28 +904,60 @@ def afterBackslash(result):
 # Character dispatch
 #-------------------------------------------------------------------------------
 
-CHAR_DISPATCH = {
-    '(': onOpenParen,
-    '{': onOpenParen,
-    '[': onOpenParen,
-    ')': onCloseParen,
-    '}': onCloseParen,
-    ']': onCloseParen,
-    BACKSLASH: onBackslash,
-    TAB: onTab,
-    NEWLINE: onNewline,
-    DOUBLE_QUOTE: onQuote,
-}
+class Dialect(object):
+    """Reader tables compiled from a dialect profile."""
+    __slots__ = (
+        'name', 'openParens', 'closeParens', 'matchParen', 'comment',
+        'blockCommentOpen', 'blockCommentClose', 'longStringFence', 'dispatch')
+
+    def __init__(self, name, profile):
+        self.name = name
+        self.openParens = frozenset(pair[0] for pair in profile['parens'])
+        self.closeParens = frozenset(pair[1] for pair in profile['parens'])
+        self.matchParen = {}
+        for openCh, closeCh in profile['parens']:
+            self.matchParen[openCh] = closeCh
+            self.matchParen[closeCh] = openCh
+        self.comment = profile['comment']
+        self.blockCommentOpen, self.blockCommentClose = profile['blockComment'] or (None, None)
+        self.longStringFence = profile['longString']
+
+        dispatch = {
+            BACKSLASH: onBackslash,
+            TAB: onTab,
+            NEWLINE: onNewline,
+            DOUBLE_QUOTE: onQuote,
+        }
+        for ch in self.openParens:
+            dispatch[ch] = onOpenParen
+        for ch in self.closeParens:
+            dispatch[ch] = onCloseParen
+        if self.blockCommentOpen:
+            dispatch[self.blockCommentOpen[0]] = onBlockCommentDelimiter
+            dispatch[self.blockCommentClose[0]] = onBlockCommentDelimiter
+        if self.longStringFence:
+            dispatch[self.longStringFence] = onLongStringFence
+        self.dispatch = dispatch
+
+DIALECTS = {}
+for name, profile in DIALECT_PROFILES.items():
+    DIALECTS[name] = Dialect(name, profile)
+
+# unknown dialects fall back to the default
+def getDialect(name):
+    return DIALECTS.get(name, DIALECTS[DEFAULT_DIALECT])
 
 def onChar(result):
     result.isEscaped = False
 
-    if result.isEscaping:
+    if result.delimiterRest > 0:
+        result.delimiterRest -= 1
+    elif result.isEscaping:
         afterBackslash(result)
     elif result.ch == result.comment:
         onComment(result)
     else:
-        dispatch = CHAR_DISPATCH.get(result.ch, None)
+        dispatch = result.dialect.dispatch.get(result.ch, None)
         if dispatch is not None:
             dispatch(result)
 
@@ -817,10 +1041,10 @@ def clampParenTrailToCursor(result):
         newStartX = max(startX, result.cursorX)
         newEndX = max(endX, result.cursorX)
 
-        line = result.lines[result.lineNo]
+        line = getLine(result, result.lineNo)
         removeCount = 0
         for i in range(startX, newStartX):
-            if line[i] in CLOSE_PARENS:
+            if line[i] in result.dialect.closeParens:
                 removeCount += 1
 
         openers = result.parenTrail.openers
@@ -851,6 +1075,22 @@ def popParenTrail(result):
 # behavior by adding its `opener.indentDelta` to the current line's indentation.
 # (care must be taken to prevent redundant indentation correction, detailed below)
 def getParentOpenerIndex(result, indentX):
+    # When nothing was shifted, the parent is the closest opener left of
+    # indentX, and while the openers' x positions are sorted we can find it
+    # with a binary search instead of walking down the stack.
+    parenStack = result.parenStack
+    top = peek(parenStack, 0)
+    if result.indentDelta == 0 and top and top.sortedStack:
+        lo = 0
+        hi = len(parenStack)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if parenStack[mid].x < indentX:
+                lo = mid + 1
+            else:
+                hi = mid
+        return len(parenStack) - lo
+
     i = 0
     # for i in range(len(result.parenStack)):
     parenStackLen = len(result.parenStack)
@@ -1035,7 +1275,7 @@ def correctParenTrail(result, indentX):
     for i in range(index):
         opener = result.parenStack.pop()
         result.parenTrail.openers.append(opener)
-        closeCh = MATCH_PAREN[opener.ch]
+        closeCh = result.dialect.matchParen[opener.ch]
         parens += closeCh
 
         if result.returnParens:
@@ -1055,11 +1295,11 @@ def cleanParenTrail(result):
         result.lineNo != result.parenTrail.lineNo):
         return
 
-    line = result.lines[result.lineNo]
+    line = getLine(result, result.lineNo)
     newTrail = ''
     spaceCount = 0
     for i in range(startX, endX):
-        if line[i] in CLOSE_PARENS:
+        if line[i] in result.dialect.closeParens:
             newTrail += line[i]
         else:
             spaceCount += 1
@@ -1071,7 +1311,7 @@ def cleanParenTrail(result):
 # PAREN MODE: append a valid close-paren to the end of the paren trail
 def appendParenTrail(result):
     opener = result.parenStack.pop()
-    closeCh = MATCH_PAREN[opener.ch]
+    closeCh = result.dialect.matchParen[opener.ch]
     if result.returnParens:
         setCloser(opener, result.parenTrail.lineNo, result.parenTrail.endX, closeCh)
 
@@ -1210,7 +1450,7 @@ def onLeadingCloseParen(result):
         result.skipChar = True
 
     if result.mode == PAREN_MODE:
-        if not isValidCloseParen(result.parenStack, result.ch):
+        if not isValidCloseParen(result.parenStack, result.ch, result.dialect.matchParen):
             if result.smart:
                 result.skipChar = True
             else:
@@ -1244,7 +1484,7 @@ def onCommentLine(result):
             result.parenStack.pop()
 
 def checkIndent(result):
-    if result.ch in CLOSE_PARENS:
+    if result.ch in result.dialect.closeParens:
         onLeadingCloseParen(result)
     elif result.ch == result.comment:
         # comments don't count as indentation points
@@ -1312,7 +1552,7 @@ def processChar(result, ch):
 
 def processLine(result, lineNo):
     initLine(result)
-    result.lines.append(result.inputLines[lineNo])
+    result.lineCount += 1
 
     setTabStops(result)
 
@@ -1374,11 +1614,20 @@ def processText(text, options, mode, smart=False):
 # Public API
 #-------------------------------------------------------------------------------
 
+def outputText(result):
+    """Joins the output lines, or returns the original text if it has them."""
+    inputLines = result.inputLines
+    changedLines = result.changedLines
+    # the lines keep their endings, so unchanged lines are the original text
+    if not changedLines and result.lineCount == len(inputLines):
+        return result.origText
+    lines = [changedLines.get(i, inputLines[i]) for i in range(result.lineCount)]
+    return joinLines(lines, result.lineEnding)
+
 def publicResult(result):
-    lineEnding = getLineEnding(result.origText)
     if result.success:
         final = {
-            'text': lineEnding.join(result.lines),
+            'text': outputText(result),
             'cursorX': result.cursorX,
             'cursorLine': result.cursorLine,
             'success': True,
@@ -1389,7 +1638,7 @@ def publicResult(result):
             final['parens'] = result.parens
     else:
         final = {
-            'text': lineEnding.join(result.lines) if result.partialResult else result.origText,
+            'text': outputText(result) if result.partialResult else result.origText,
             'cursorX': result.cursorX if result.partialResult else result.origCursorX,
             'cursorLine': result.cursorLine if result.partialResult else result.origCursorLine,
             'parenTrails': result.parenTrails if result.partialResult else None,
@@ -1417,11 +1666,374 @@ def smart_mode(text, options):
     smart = False
     if isinstance(options, dict):
         smart = 'selectionStartLine' not in options or options['selectionStartLine'] is None
+    elif isinstance(options, Options):
+        smart = options.selectionStartLine is None
     return publicResult(processText(text, options, INDENT_MODE, smart))
 
+#-------------------------------------------------------------------------------
+# Check Mode
+#-------------------------------------------------------------------------------
+
+# Check Mode only runs the reader (strings, comments, escapes and the paren
+# stack) to tell if Paren Mode would succeed, and with which error otherwise.
+# It builds no output and jumps between tokens with a regex instead of
+# dispatching every character.
+
+checkTokenRegexes = {}
+
+def getCheckTokenRegex(dialect, comment):
+    key = (dialect.name, comment)
+    tokenRegex = checkTokenRegexes.get(key)
+    if tokenRegex is None:
+        tokens = list(dialect.openParens | dialect.closeParens) + [DOUBLE_QUOTE, BACKSLASH, comment]
+        if dialect.blockCommentOpen:
+            tokens += [dialect.blockCommentOpen, dialect.blockCommentClose]
+        # longest first, so that ie: `#|` wins over a `#` comment character
+        tokens.sort(key=len, reverse=True)
+        pattern = '|'.join(re.escape(token) for token in tokens)
+        if dialect.longStringFence:
+            pattern = re.escape(dialect.longStringFence) + '+|' + pattern
+        tokenRegex = re.compile(pattern)
+        checkTokenRegexes[key] = tokenRegex
+    return tokenRegex
+
+def checkError(name, lineNo, x, opener=None):
+    e = {
+        'name': name,
+        'message': errorMessages[name],
+        'lineNo': lineNo,
+        'x': x,
+    }
+    if opener is not None:
+        e['extra'] = {
+            'name': ERROR_UNMATCHED_OPEN_PAREN,
+            'lineNo': opener[1],
+            'x': opener[2],
+        }
+    return {'success': False, 'error': e}
+
+class Checker(object):
+    """
+    The reader of Check Mode, which can be resumed between lines: feed it the
+    lines of a text in as many calls as needed, then call `finish`.
+    """
+    __slots__ = (
+        'dialect', 'comment', 'tokenRegex', 'parenStack', 'strClose',
+        'blockCommentDepth', 'strStart', 'quoteDanger', 'result')
+
+    def __init__(self, options=None):
+        if not isinstance(options, Options):
+            options = Options(options)
+        self.dialect = options.dialect
+        self.comment = options.comment
+        self.tokenRegex = getCheckTokenRegex(self.dialect, self.comment)
+
+        self.parenStack = []        # (ch, lineNo, x) of the open parens
+        self.strClose = None        # delimiter that closes the current string (or block comment)
+        self.blockCommentDepth = 0
+        self.strStart = None        # (lineNo, x) of the last opened string
+        self.quoteDanger = None     # (lineNo, x) where quotes in comments became imbalanced
+        self.result = None          # the error result, once there is one
+
+    def state(self):
+        """Returns the reader state between two lines, to `restore` it later."""
+        return (tuple(self.parenStack), self.strClose, self.blockCommentDepth,
+                self.strStart, self.quoteDanger)
+
+    def restore(self, state):
+        parenStack, self.strClose, self.blockCommentDepth, self.strStart, self.quoteDanger = state
+        self.parenStack = list(parenStack)
+        self.result = None
+
+    def feed(self, lines, start=0, end=None):
+        """
+        Reads lines[start:end], where the index of a line is its line number.
+        Returns the error result if one is found (and then keeps returning it).
+        """
+        if self.result is not None:
+            return self.result
+        if end is None:
+            end = len(lines)
+
+        dialect = self.dialect
+        comment = self.comment
+        tokenRegex = self.tokenRegex
+        openParens = dialect.openParens
+        closeParens = dialect.closeParens
+        matchParen = dialect.matchParen
+        blockCommentOpen = dialect.blockCommentOpen
+        blockCommentClose = dialect.blockCommentClose
+        fence = dialect.longStringFence
+
+        parenStack = self.parenStack
+        strClose = self.strClose
+        blockCommentDepth = self.blockCommentDepth
+        strStart = self.strStart
+        quoteDanger = self.quoteDanger
+        error = None
+
+        for lineNo in range(start, end):
+            line = lines[lineNo]
+            isInComment = False
+            escapeEnd = -1
+            pos = 0
+
+            # imbalanced quotes in comments are an error once a line of code follows
+            indentX = None
+            if quoteDanger and strClose is None:
+                indentX = 0
+                while indentX < len(line) and (line[indentX] in closeParens or line[indentX] in (BLANK_SPACE, TAB)):
+                    indentX += 1
+                if indentX == len(line) or line[indentX] == comment:
+                    indentX = None
+
+            while True:
+                match = tokenRegex.search(line, pos)
+                if match is None:
+                    break
+                x = match.start()
+                token = match.group()
+                pos = match.end()
+
+                if indentX is not None and x >= indentX:
+                    break
+
+                if x < escapeEnd:
+                    # only the first character of the token is escaped
+                    pos = escapeEnd
+                elif token == BACKSLASH:
+                    if strClose is None or strClose == DOUBLE_QUOTE:
+                        escapeEnd = x + 2
+                elif isInComment:
+                    if token == DOUBLE_QUOTE:
+                        quoteDanger = None if quoteDanger else (lineNo, x)
+                elif strClose == DOUBLE_QUOTE:
+                    if token == DOUBLE_QUOTE:
+                        strClose = None
+                elif strClose is not None and strClose == blockCommentClose:
+                    if token == blockCommentClose:
+                        blockCommentDepth -= 1
+                        if blockCommentDepth == 0:
+                            strClose = None
+                    elif token == blockCommentOpen:
+                        blockCommentDepth += 1
+                elif strClose is not None:
+                    # a long string closes at the first run of enough fence characters
+                    if token[0] == fence and len(token) >= len(strClose):
+                        pos = x + len(strClose)
+                        strClose = None
+                elif token == DOUBLE_QUOTE:
+                    strClose = DOUBLE_QUOTE
+                    strStart = (lineNo, x)
+                elif token == comment:
+                    isInComment = True
+                elif token == blockCommentOpen:
+                    strClose = blockCommentClose
+                    blockCommentDepth = 1
+                    strStart = (lineNo, x)
+                elif token[0] == fence:
+                    strClose = token
+                    strStart = (lineNo, x)
+                elif token in openParens:
+                    parenStack.append((token, lineNo, x))
+                elif token in closeParens:
+                    opener = parenStack[-1] if parenStack else None
+                    if opener is None or opener[0] != matchParen[token]:
+                        error = checkError(ERROR_UNMATCHED_CLOSE_PAREN, lineNo, x, opener)
+                        break
+                    parenStack.pop()
+                elif token == blockCommentClose:
+                    # not a delimiter outside of a block comment, but `|#|` still opens one
+                    pos = x + 1
+
+            if error is not None:
+                break
+            if indentX is not None:
+                error = checkError(ERROR_QUOTE_DANGER, quoteDanger[0], quoteDanger[1])
+                break
+
+            # a backslash at the end of a line escapes the newline
+            if escapeEnd > len(line) and strClose is None and not isInComment:
+                error = checkError(ERROR_EOL_BACKSLASH, lineNo, len(line) - 1)
+                break
+
+        self.strClose = strClose
+        self.blockCommentDepth = blockCommentDepth
+        self.strStart = strStart
+        self.quoteDanger = quoteDanger
+        self.result = error
+        return error
+
+    def finish(self):
+        """Returns the result of Check Mode for all of the lines fed so far."""
+        if self.result is None:
+            if self.quoteDanger:
+                self.result = checkError(ERROR_QUOTE_DANGER, self.quoteDanger[0], self.quoteDanger[1])
+            elif self.strClose is not None:
+                self.result = checkError(ERROR_UNCLOSED_QUOTE, self.strStart[0], self.strStart[1])
+            elif self.parenStack:
+                opener = self.parenStack[-1]
+                self.result = checkError(ERROR_UNCLOSED_PAREN, opener[1], opener[2])
+            else:
+                self.result = {'success': True}
+        return self.result
+
+def check_mode(text, options=None):
+    """
+    Returns {'success': True} if Paren Mode would succeed on text. Otherwise
+    returns {'success': False, 'error': error} with the error Paren Mode
+    would report. Only the `dialect` and `comment` options are used.
+    """
+    checker = Checker(options)
+    return checker.feed(splitLines(text)[0]) or checker.finish()
+
+#-------------------------------------------------------------------------------
+# Batch API
+#-------------------------------------------------------------------------------
+
+BATCH_MODES = {
+    'indent_mode': indent_mode,
+    'paren_mode': paren_mode,
+    'smart_mode': smart_mode,
+    'check_mode': check_mode,
+}
+
+BATCH_CHUNK_SIZE = 32
+
+def batchChunk(mode, items):
+    fn = BATCH_MODES[mode]
+    parsedOptions = {}
+    results = []
+    for text, options in items:
+        # the same options object is only parsed once
+        key = id(options)
+        if key not in parsedOptions:
+            parsedOptions[key] = options if isinstance(options, Options) else Options(options)
+        startTime = time.perf_counter()
+        result = fn(text, parsedOptions[key])
+        results.append((result, time.perf_counter() - startTime))
+    return results
+
+def batch(items, mode='paren_mode', workers=0, chunkSize=BATCH_CHUNK_SIZE):
+    """
+    Runs `mode` (ie: 'indent_mode' or 'check_mode') over a sequence
+    of (text, options) pairs and returns a list of (result, seconds) pairs in
+    the same order. Items that share an options object share its parse.
+
+    With `workers` > 0, chunks of `chunkSize` items are processed on a
+    process pool of that size.
+    """
+    if mode not in BATCH_MODES:
+        raise ValueError('unknown mode: ' + str(mode))
+    items = list(items)
+    if not workers:
+        return batchChunk(mode, items)
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    chunks = [items[i:i+chunkSize] for i in range(0, len(items), chunkSize)]
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for chunkResults in executor.map(batchChunk, [mode] * len(chunks), chunks):
+            results.extend(chunkResults)
+    return results
+
+if RUN_ASSERTS:
+    assert batch([('(a\n b', Options({'cursorLine': 1, 'cursorX': 2}))], 'indent_mode')[0][0]['cursorX'] == 2
+
+#-------------------------------------------------------------------------------
+# Engine Server
+#-------------------------------------------------------------------------------
+
+# `python parinfer.py --server` runs the engine in its own process. It reads
+# newline-delimited JSON messages on stdin and answers each request with one
+# line on stdout:
+#
+#   request:  {"id": 1, "mode": "paren_mode", "text": "...", "options": {...}}
+#   cancel:   {"id": 1, "cancel": true}
+#   response: {"id": 1, "result": {...}}
+#             {"id": 1, "cancelled": true}
+#             {"id": 1, "error": "..."}
+#
+# Requests are answered in order. A reader thread queues them as they arrive so
+# that a cancel can overtake a request that is still waiting for its turn.
+
+def readServerRequests(inStream, requests, waiting, cancelled, lock):
+    import json
+
+    for line in inStream:
+        try:
+            message = json.loads(line)
+        except ValueError:
+            continue
+        requestId = message.get('id')
+        with lock:
+            if message.get('cancel'):
+                if requestId in waiting:
+                    cancelled.add(requestId)
+            else:
+                waiting.add(requestId)
+                requests.put(message)
+
+    # end of input
+    requests.put(None)
+
+def answerServerRequest(message):
+    """Returns the response to a request, as one line of JSON."""
+    import json
+
+    requestId = message.get('id')
+    mode = message.get('mode')
+    if mode not in BATCH_MODES:
+        return json.dumps({'id': requestId, 'error': 'unknown mode: ' + str(mode)})
+    try:
+        result = BATCH_MODES[mode](message.get('text', ''), message.get('options') or {})
+        # NOTE: serializing can fail too (ie: the parens of `returnParens`)
+        return json.dumps({'id': requestId, 'result': result})
+    except Exception as e:
+        return json.dumps({'id': requestId, 'error': repr(e)})
+
+def serve(inStream, outStream):
+    import json
+    import queue
+    import threading
+
+    requests = queue.Queue()
+    waiting = set()
+    cancelled = set()
+    lock = threading.Lock()
+
+    reader = threading.Thread(target=readServerRequests,
+                              args=(inStream, requests, waiting, cancelled, lock))
+    reader.daemon = True
+    reader.start()
+
+    while True:
+        message = requests.get()
+        if message is None:
+            return
+        requestId = message.get('id')
+        with lock:
+            waiting.discard(requestId)
+            isCancelled = requestId in cancelled
+            cancelled.discard(requestId)
+
+        if isCancelled:
+            response = json.dumps({'id': requestId, 'cancelled': True})
+        else:
+            response = answerServerRequest(message)
+        outStream.write(response + NEWLINE)
+        outStream.flush()
+
 API = {
     'version': '3.12.0',
     'indent_mode': indent_mode,
     'paren_mode': paren_mode,
-    'smart_mode': smart_mode
+    'smart_mode': smart_mode,
+    'check_mode': check_mode,
+    'batch': batch,
 }
+
+if __name__ == '__main__':
+    if '--server' in sys.argv[1:]:
+        serve(sys.stdin, sys.stdout)
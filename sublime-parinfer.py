@@ -11,18 +11,31 @@ Released under the ISC license
 https://github.com/oakmac/sublime-text-parinfer/blob/master/LICENSE.md
 """
 
+import time
+
+# taken before the other imports, which are part of loading the plugin
+plugin_import_started_at = time.perf_counter()
+
+import bisect
+import collections
+import cProfile
 import functools
+import hashlib
+import heapq
+import html
+import io
+import json
+import os
+import pstats
 import re
+import subprocess
+import sys
+import tempfile
+import threading
 
 import sublime
 import sublime_plugin
 
-try:
-    # Python 2
-    from parinfer import indent_mode, paren_mode
-except ImportError:
-    from .parinfer import indent_mode, paren_mode
-
 try:
     basestring
 except NameError:
@@ -33,7 +46,10 @@ DEBUG_LOGGING = False
 
 # constants
 DEBOUNCE_INTERVAL_MS = 50
+ACTIVATION_INTERVAL_MS = 25
 STATUS_KEY = 'parinfer'
+VALIDATION_STATUS_KEY = 'parinfer_validation'
+ERROR_REGION_KEY = 'parinfer_error'
 PENDING_STATUS = 'Parinfer: Waiting'
 INDENT_STATUS = 'Parinfer: Indent'
 PAREN_STATUS = 'Parinfer: Paren'
@@ -41,6 +57,77 @@ ALL_STATUSES = [PENDING_STATUS, INDENT_STATUS, PAREN_STATUS]
 PARENT_EXPRESSION_RE = re.compile(r"^\([a-zA-Z]")
 SYNTAX_LANGUAGE_RE = r"([\w\d\s]*)(\.sublime-syntax)"
 
+# activation priorities for newly loaded views (lower runs first)
+ACTIVE_VIEW_PRIORITY = 0
+VISIBLE_VIEW_PRIORITY = 1
+BACKGROUND_VIEW_PRIORITY = 2
+
+# profiling
+PROFILE_PANEL_NAME = 'parinfer_profile'
+PROFILE_TOP_N = 40
+
+# whole-buffer validation: how long each slice of work may take and how many
+# lines we check between looking at the clock
+VALIDATION_SLICE_MS = 10
+VALIDATION_SLICE_LINES = 500
+
+# rainbow delimiters: how long after an edit we draw them again, and how often
+# and for how long after the last input we look for scrolling
+DELIMITER_DELAY_MS = 100
+DELIMITER_POLL_MS = 200
+DELIMITER_POLL_IDLE_MS = 60000
+DELIMITER_REGION_KEY = 'parinfer_delimiters_%d'
+MATCH_REGION_KEY = 'parinfer_match'
+
+# paren trees: how many top-level forms we keep the tree of
+PAREN_TREE_CACHE_FORMS = 500
+
+# Paren Mode cache: how long to collect changes before writing them to disk,
+# and the version of its keys (bump it when the output of the engine changes,
+# so that files left clean by the old engine are processed again)
+CLEAN_CACHE_FILE_NAME = 'paren-mode-clean.json'
+CLEAN_CACHE_SAVE_DELAY_MS = 2000
+CLEAN_CACHE_VERSION = 2
+
+# latency budget: overruns in a row before a view steps down to a cheaper
+# level, fast runs in a row before it steps back up, how much smaller the
+# bounded window gets and how long the debounce gets
+LATENCY_OVERRUNS_TO_DOWNGRADE = 3
+LATENCY_FAST_RUNS_TO_RECOVER = 20
+LATENCY_BOUNDED_DIVISOR = 4
+SLOW_DEBOUNCE_INTERVAL_MS = 250
+
+# engine server: stop restarting it after this many crashes within the window
+ENGINE_SERVER_MAX_CRASHES = 3
+ENGINE_SERVER_CRASH_WINDOW_S = 60
+
+# bounded mode: how often (in lines) we save the scanner state inside a form
+SCAN_CHECKPOINT_INTERVAL = 64
+
+# Parinfer dialects by (lowercase) syntax name, or by file extension when the
+# syntax is not known
+DIALECT_SYNTAXES = {
+    'racket': 'racket',
+    'scheme': 'racket',
+    'janet': 'janet',
+    'lfe': 'lfe',
+}
+DIALECT_EXTENSIONS = {
+    '.rkt': 'racket',
+    '.janet': 'janet',
+    '.lfe': 'lfe',
+}
+DEFAULT_DIALECT = 'clojure' # same as parinfer.DEFAULT_DIALECT
+
+# comment character of each dialect (same as parinfer.DIALECT_PROFILES), so
+# that finding it does not import the engine
+DIALECT_COMMENTS = {
+    'clojure': ';',
+    'racket': ';',
+    'janet': '#',
+    'lfe': ';',
+}
+
 
 def debug_log(x):
     if DEBUG_LOGGING == True:
@@ -59,7 +146,7 @@ def get_syntax_language(view):
 comment_chars = {}
 
 def get_comment_char(view):
-    comment_char = ';'
+    comment_char = DIALECT_COMMENTS[get_view_dialect(view)]
     srclang = get_syntax_language(view)
 
     if srclang in comment_chars:
@@ -77,6 +164,25 @@ def get_comment_char(view):
     return comment_char
 
 
+# syntax language -> dialect name
+dialects = {}
+
+def get_view_dialect(view):
+    srclang = get_syntax_language(view)
+    if srclang in dialects:
+        return dialects[srclang]
+
+    syntax_name = (srclang or '').strip().lower()
+    for key, dialect in DIALECT_SYNTAXES.items():
+        if key in syntax_name:
+            dialects[srclang] = dialect
+            return dialect
+
+    # plain text or an unknown syntax, so go by the file extension
+    _root, ext = os.path.splitext(view.file_name() or '')
+    return DIALECT_EXTENSIONS.get(ext.lower(), DEFAULT_DIALECT)
+
+
 def get_setting(view, key):
     settings = view.settings().get('Parinfer')
     if settings is None:
@@ -107,29 +213,1704 @@ def find_end_parent_expression(lines, line_no):
     return max_idx
 
 
+# When the syntax scopes parens, strings and comments, we can find the parent
+# expressions with the view's (native) search and the syntax's parse instead of
+# splitting the whole buffer into lines. Above the cursor, an open paren at the
+# start of a line only counts when it is code and not nested in another form.
+# Below the cursor the scopes are not to be trusted while the user is typing
+# (ie: a new open paren or quote changes the scopes of everything after it),
+# so there we go by the text like find_end_parent_expression.
+
+PARENT_EXPRESSION_SELECTOR = 'punctuation - string - comment'
+FORM_META_SCOPE_RE = re.compile(r"\bmeta\.(?:parens|brackets|braces|sexp|list)\b")
+
+# how many characters above the cursor we first search for the start of a form
+PARENT_EXPRESSION_SEARCH_BLOCK = 1024
+
+# syntax language -> True if the syntax scopes parens, strings and comments
+form_scope_support = {}
+
+def has_form_scopes(view, point):
+    srclang = get_syntax_language(view)
+    if srclang not in form_scope_support:
+        form_scope_support[srclang] = view.match_selector(point, 'punctuation, string, comment')
+    return form_scope_support[srclang]
+
+
+def is_scoped_parent_expression(view, point):
+    if not view.match_selector(point, PARENT_EXPRESSION_SELECTOR):
+        return False
+    # the scope of an open paren includes the form it opens
+    return len(FORM_META_SCOPE_RE.findall(view.scope_name(point))) <= 1
+
+
+def find_region(view, pattern, point):
+    region = view.find(pattern, point)
+    if region is None or region.a < 0:
+        return None
+    return region
+
+
+def find_scoped_parent_expressions(view, line_no):
+    """
+    Returns the same (start line, end line) as find_start_parent_expression and
+    find_end_parent_expression, or None when the syntax does not have the
+    scopes we need.
+    """
+    size = view.size()
+    last_row = view.rowcol(size)[0]
+    # a buffer that does not end with a newline gets one more (empty) line
+    max_idx = last_row
+    if size > 0 and view.substr(size - 1) != "\n":
+        max_idx = last_row + 1
+
+    # the first parent expression after the cursor line
+    end_line = max_idx
+    if line_no + 1 <= last_row:
+        region = find_region(view, PARENT_EXPRESSION_RE.pattern, view.text_point(line_no + 1, 0))
+        if region is not None:
+            end_line = view.rowcol(region.a)[0]
+
+    # the last parent expression before the cursor line, searching back a block at a time
+    start_line = 0
+    limit = view.text_point(line_no, 0)
+    block = PARENT_EXPRESSION_SEARCH_BLOCK
+    while limit > 0:
+        begin = view.line(max(0, limit - block)).a
+        candidates = []
+        region = find_region(view, PARENT_EXPRESSION_RE.pattern, begin)
+        while region is not None and region.a < limit:
+            candidates.append(region.a)
+            region = find_region(view, PARENT_EXPRESSION_RE.pattern, region.b)
+        # the closest one to the cursor that is really a parent expression
+        for point in reversed(candidates):
+            if not has_form_scopes(view, point):
+                return None
+            if is_scoped_parent_expression(view, point):
+                start_line = view.rowcol(point)[0]
+                return start_line, end_line
+        limit = begin
+        block = block * 2
+
+    return start_line, end_line
+
+
+def find_parent_expressions_around(view, first_row, last_row):
+    """
+    Returns (start line, end line) of the parent expressions around the rows
+    first_row to last_row.
+    """
+    start_bounds = find_scoped_parent_expressions(view, first_row)
+    end_bounds = find_scoped_parent_expressions(view, last_row)
+    if start_bounds is not None and end_bounds is not None:
+        return start_bounds[0], end_bounds[1]
+    lines = buffer_lines(view)
+    return (find_start_parent_expression(lines, first_row),
+            find_end_parent_expression(lines, last_row))
+
+
+def buffer_lines(view):
+    lines = view.substr(sublime.Region(0, view.size())).split("\n")
+    # add a newline at the end of the file if there is not one
+    if lines[-1] != "":
+        lines.append("")
+    return lines
+
+
+def line_starts(lines):
+    starts = []
+    offset = 0
+    for line in lines:
+        starts.append(offset)
+        offset = offset + len(line) + 1
+    return starts
+
+
+# -----------------------------------------------------------------------------
+# Engine
+# -----------------------------------------------------------------------------
+# parinfer.py is imported when it is first used (ie: by the first Parinfer
+# view), so starting Sublime Text without any Lisp files open does not pay for
+# it. "Parinfer: Show Startup Times" reports what loading took.
+
+engine = None
+
+# 'plugin_import', 'engine_import' and 'first_run' -> seconds
+startup_times = {}
+
+def get_engine():
+    global engine
+    if engine is None:
+        started_at = time.perf_counter()
+        try:
+            # Python 2
+            import parinfer as module
+        except ImportError:
+            from . import parinfer as module
+        startup_times['engine_import'] = time.perf_counter() - started_at
+        engine = module
+    return engine
+
+def call_engine(name, text, options):
+    fn = getattr(get_engine(), name)
+    if 'first_run' in startup_times:
+        return fn(text, options)
+    started_at = time.perf_counter()
+    result = fn(text, options)
+    startup_times['first_run'] = time.perf_counter() - started_at
+    return result
+
+def indent_mode(text, options):
+    return call_engine('indent_mode', text, options)
+
+def paren_mode(text, options):
+    return call_engine('paren_mode', text, options)
+
+def smart_mode(text, options):
+    return call_engine('smart_mode', text, options)
+
+def get_dialect(name):
+    return get_engine().getDialect(name)
+
+
+# -----------------------------------------------------------------------------
+# Errors
+# -----------------------------------------------------------------------------
+# When Parinfer fails on a form, we keep the error per buffer and draw it in
+# the views of that buffer. Running Parinfer again on the same text would fail
+# the same way, so the error is kept until a change touches the form.
+
+class FormError(object):
+    """
+    The error of the last failed Parinfer run on a buffer. Rows are buffer
+    rows; start_line and end_line are the lines of the form that failed.
+    """
+    def __init__(self, error, status, text, start_line, end_line):
+        self.name = error['name']
+        self.message = error['message']
+        self.status = status
+        self.text = text
+        self.start_line = start_line
+        self.end_line = end_line
+
+        # (row, col) of the error and of the position related to it (ie: the
+        # open paren an unmatched close paren should have matched)
+        self.positions = [(start_line + error['lineNo'], error['x'])]
+        extra = error.get('extra')
+        if extra and extra.get('lineNo') is not None:
+            self.positions.append((start_line + extra['lineNo'], extra['x']))
+
+    def is_same_run(self, status, text, start_line):
+        return self.status == status and self.start_line == start_line and self.text == text
+
+    def shift(self, delta):
+        self.start_line = self.start_line + delta
+        self.end_line = self.end_line + delta
+        self.positions = [(row + delta, col) for row, col in self.positions]
+
+
+# buffer_id -> FormError
+form_errors = {}
+
+def show_form_error(view, form_error):
+    form_errors[view.buffer_id()] = form_error
+
+    for error_view in view.buffer().views():
+        regions = []
+        for row, col in form_error.positions:
+            point = error_view.text_point(row, col)
+            regions.append(sublime.Region(point, min(point + 1, error_view.line(point).end())))
+        annotations = ['Parinfer: ' + html.escape(form_error.message)] + [''] * (len(regions) - 1)
+        error_view.add_regions(ERROR_REGION_KEY, regions, 'invalid', '',
+                               sublime.DRAW_EMPTY | sublime.DRAW_NO_FILL,
+                               annotations=annotations)
+
+
+def clear_form_error(buffer):
+    if form_errors.pop(buffer.id(), None) is None:
+        return
+    for view in buffer.views():
+        view.erase_regions(ERROR_REGION_KEY)
+
+
+# -----------------------------------------------------------------------------
+# Cursor Moves
+# -----------------------------------------------------------------------------
+# In Indent Mode the cursor only changes the result on lines with a paren
+# trail: a cursor inside or after a trail holds the parens before it in place.
+# We keep the rows with paren trails of the last run on each view so that other
+# cursor moves do not have to run Parinfer at all.
+
+class LastResult(object):
+    """
+    The last successful Indent Mode run on a view. change_count is the change
+    count of the view once its text matches the result (None until then).
+    """
+    def __init__(self, start_line, end_line, cursor, trail_rows):
+        self.start_line = start_line
+        self.end_line = end_line
+        self.cursor = cursor            # (row, col) of the cursor for the run
+        self.trail_rows = trail_rows    # set of rows with a paren trail
+        self.change_count = None
+
+    def cursor_matters(self, cursor_row):
+        return self.cursor[0] in self.trail_rows or cursor_row in self.trail_rows
+
+    def needs_run(self, cursor_row):
+        if cursor_row < self.start_line or cursor_row >= self.end_line:
+            return True
+        return self.cursor_matters(cursor_row)
+
+
+# view_id -> LastResult
+last_results = {}
+
+def cursor_move_needs_run(view):
+    last_result = last_results.get(view.id())
+    if last_result is None or last_result.change_count != view.change_count():
+        return True
+    selections = view.sel()
+    if len(selections) == 0:
+        return False
+    cursor_row, _cursor_col = view.rowcol(selections[0].begin())
+    return last_result.needs_run(cursor_row)
+
+
+# -----------------------------------------------------------------------------
+# Pasted Code
+# -----------------------------------------------------------------------------
+# Indent Mode would rewrite the parens of pasted code to match its indentation,
+# which rarely fits where it was pasted. So the next run after code is pasted
+# (or otherwise inserted over more than one line) is Paren Mode on the forms
+# around it, with the insertion passed to the engine as a change so that the
+# code after it on the same line moves along with it.
+
+class PastedCode(object):
+    """
+    A multi-line insertion waiting for the next run. start_row and end_row are
+    the first and last rows of the inserted text.
+    """
+    def __init__(self, change):
+        self.start_row = change.a.row
+        self.end_row = change.a.row + change.str.count("\n")
+        self.col = change.a.col
+        self.text = change.str
+        # the engine only looks at the shape of the text that was replaced
+        replaced_rows = change.b.row - change.a.row
+        if replaced_rows == 0:
+            self.replaced = " " * (change.b.col - change.a.col)
+        else:
+            self.replaced = "\n" * replaced_rows + " " * change.b.col
+
+    def engine_change(self, start_line):
+        return {
+            'lineNo': self.start_row - start_line,
+            'x': self.col,
+            'oldText': self.replaced,
+            'newText': self.text,
+        }
+
+
+# buffer_id -> PastedCode
+pasted_code = {}
+
+# buffer_id -> [(a, b, str)] of the changes ParinferApplyCommand made that the
+# change listener has not reported yet
+applied_changes = {}
+
+def is_applied_change(buffer_id, change):
+    pending = applied_changes.get(buffer_id)
+    event = (change.a.pt, change.b.pt, change.str)
+    if pending and event in pending:
+        del pending[:pending.index(event) + 1]
+        return True
+    return False
+
+def is_pasted_code(change):
+    # pressing enter inserts a newline and the indentation of the next line
+    return "\n" in change.str and change.str.strip() != ""
+
+
+# -----------------------------------------------------------------------------
+# Block Indentation
+# -----------------------------------------------------------------------------
+# Sublime's indent and unindent commands change the indentation of every
+# selected line. While Parinfer is on we run them in ParinferIndentCommand,
+# which passes those changes to the engine in one run and applies the result
+# in the same command, so that it is one undo step.
+
+# ids of the views ParinferIndentCommand is running indent or unindent in
+indenting_views = set()
+
+def indentation_changes(old_text, new_text):
+    """
+    Returns the engine changes that turn the indentation of the lines of
+    old_text into that of new_text, which only differs in indentation.
+    """
+    changes = []
+    for line_no, (old_line, new_line) in enumerate(zip(old_text.split("\n"), new_text.split("\n"))):
+        if old_line != new_line:
+            old_indent = old_line[:len(old_line) - len(old_line.lstrip(" \t"))]
+            new_indent = new_line[:len(new_line) - len(new_line.lstrip(" \t"))]
+            changes.append({
+                'lineNo': line_no,
+                'x': 0,
+                'oldText': old_indent,
+                'newText': new_indent,
+            })
+    return changes
+
+
+# -----------------------------------------------------------------------------
+# Bounded Mode
+# -----------------------------------------------------------------------------
+# When a top-level form is larger than the configured budget, Indent Mode only
+# processes the largest enclosing form around the cursor that fits the budget,
+# or, when the cursor is directly inside a huge form (ie: a vector of maps),
+# the lines of the items around the cursor. Finding those needs the paren
+# stack at the cursor, which we read with the engine's Check Mode reader, and
+# we keep a cache of its states ("checkpoints") at regular line intervals
+# inside the form.
+
+class FormScanCache(object):
+    """
+    Reader states at the start of every SCAN_CHECKPOINT_INTERVAL-th line of
+    the top-level form that begins at start_line.
+    """
+    def __init__(self, start_line):
+        self.start_line = start_line
+        self.checkpoints = {start_line: None}   # None is the state of a new reader
+
+    def store(self, row, checker):
+        if (row - self.start_line) % SCAN_CHECKPOINT_INTERVAL == 0:
+            self.checkpoints[row] = checker.state()
+
+    def nearest(self, row):
+        best = self.start_line
+        for checkpoint_row in self.checkpoints:
+            if best < checkpoint_row <= row:
+                best = checkpoint_row
+        return best, self.checkpoints[best]
+
+    # a change on row only affects the states saved after it
+    def invalidate_from(self, row):
+        for checkpoint_row in list(self.checkpoints):
+            if checkpoint_row > row and checkpoint_row != self.start_line:
+                del self.checkpoints[checkpoint_row]
+
+
+# buffer_id -> FormScanCache
+form_scan_caches = {}
+
+def get_form_scan_cache(buffer_id, start_line):
+    cache = form_scan_caches.get(buffer_id)
+    if cache is None or cache.start_line != start_line:
+        cache = FormScanCache(start_line)
+        form_scan_caches[buffer_id] = cache
+    return cache
+
+
+def line_indentation(line):
+    return len(line) - len(line.lstrip(' '))
+
+
+def is_blank_or_comment(line, comment_char):
+    stripped = line.strip()
+    return stripped == '' or stripped.startswith(comment_char)
+
+
+def read_edited_line(checker, line, row):
+    """
+    Reads the line the user is editing the way Indent Mode does, which drops
+    the close parens that do not match. Returns False if it cannot be read.
+    """
+    state = checker.state()
+    while True:
+        # the checker only looks up lines[row]
+        error = checker.feed({row: line}, row, row + 1)
+        if error is None:
+            return True
+        if error['error']['name'] != get_engine().ERROR_UNMATCHED_CLOSE_PAREN:
+            return False
+        x = error['error']['x']
+        line = line[:x] + ' ' + line[x + 1:]
+        checker.restore(state)
+
+
+def read_to_cursor(lines, cursor_row, cursor_col, cache, dialect, comment_char):
+    """
+    Returns (enclosing, row_stacks, line_stack), where enclosing are the open
+    parens around the cursor as (ch, row, col), row_stacks maps the lines read
+    (that do not start in a string) to the open parens at their start and
+    line_stack are the open parens at the end of the cursor line (or None if
+    it cannot be read). Returns None if the text cannot be read to the cursor.
+    """
+    checkpoint_row, state = cache.nearest(cursor_row)
+    checker = get_engine().Checker({'dialect': dialect, 'comment': comment_char})
+    if state is not None:
+        checker.restore(state)
+
+    # NOTE: we also check that the parens agree with the indentation of each
+    # line (as they do after Indent Mode has run); otherwise we give up
+    row_stacks = {}
+    for row in range(checkpoint_row, cursor_row + 1):
+        line = lines[row]
+        if checker.strClose is None:
+            stack = checker.parenStack
+            if (len(stack) > 0 and not is_blank_or_comment(line, comment_char) and
+                    line_indentation(line) <= max(col for _ch, _row, col in stack)):
+                return None
+            row_stacks[row] = tuple(stack)
+        if row == cursor_row:
+            break
+        cache.store(row, checker)
+        if checker.feed(lines, row, row + 1) is not None:
+            return None
+    cache.store(cursor_row, checker)
+
+    line_state = checker.state()
+    line = lines[cursor_row]
+    if not read_edited_line(checker, line[:cursor_col], cursor_row):
+        return None
+    enclosing = list(checker.parenStack)
+
+    checker.restore(line_state)
+    line_stack = None
+    if read_edited_line(checker, line, cursor_row):
+        line_stack = checker.parenStack
+    return enclosing, row_stacks, line_stack
+
+
+def expected_outer_closers(outer_openers, next_indent, dialect):
+    """
+    The close parens Indent Mode puts after a form for the openers around it,
+    given the indentation of the next line of code.
+    """
+    closers = ''
+    for ch, _row, col in reversed(outer_openers):
+        if col < next_indent:
+            break
+        closers += dialect.matchParen[ch]
+    return closers
+
+
+def find_bounded_window(lines, end_line, cursor_row, enclosing, dialect, comment_char,
+                        max_lines, max_chars):
+    """
+    Returns (open_row, open_col, end_row, outer_closers) for the largest form
+    around the cursor that fits the budget, where end_row is the last line of
+    code inside the form (following Indent Mode, the form ends before the next
+    line of code indented at or before its open paren) and outer_closers are
+    the close parens Indent Mode puts after the form on that line.
+    Returns None if there is no such form.
+    """
+    # (row, indentation) of the lines of code after the cursor, collected lazily
+    code_lines = []
+    next_row = cursor_row + 1
+
+    best = None
+    for depth in range(len(enclosing) - 1, -1, -1):
+        _ch, open_row, open_col = enclosing[depth]
+        if cursor_row - open_row >= max_lines:
+            break
+
+        # every line of code between the open paren and the cursor must be inside the form
+        if any(line_indentation(line) <= open_col
+               for line in lines[open_row + 1:cursor_row + 1]
+               if not is_blank_or_comment(line, comment_char)):
+            break
+
+        # find the next line of code that is not indented past the open paren
+        next_idx = None
+        for idx, (_row, indent) in enumerate(code_lines):
+            if indent <= open_col:
+                next_idx = idx
+                break
+        while next_idx is None and next_row < end_line:
+            if next_row - open_row >= max_lines:
+                break
+            line = lines[next_row]
+            if not is_blank_or_comment(line, comment_char):
+                code_lines.append((next_row, line_indentation(line)))
+                if code_lines[-1][1] <= open_col:
+                    next_idx = len(code_lines) - 1
+            next_row = next_row + 1
+
+        if next_idx is not None:
+            next_indent = code_lines[next_idx][1]
+        elif next_row >= end_line:
+            # the next top-level form (or the end of the file) closes everything
+            next_idx = len(code_lines)
+            next_indent = 0
+        else:
+            break
+        end_row = code_lines[next_idx - 1][0] if next_idx > 0 else cursor_row
+
+        # stop once the forms no longer fit the budget
+        if (end_row - open_row + 1 > max_lines or
+                sum(map(len, lines[open_row:end_row + 1])) > max_chars):
+            break
+
+        # the cursor must not be on the line with the closing paren trail
+        if end_row <= cursor_row:
+            continue
+
+        best = (open_row, open_col, end_row, expected_outer_closers(enclosing[:depth], next_indent, dialect))
+
+    return best
+
+
+def begins_item(lines, row_stacks, row, depth, comment_char):
+    """
+    Returns True if Indent Mode would read row as the start of an item of the
+    form open at depth: the form is the innermost one open at its start, and
+    the close parens at the end of the line of code above it (which Indent
+    Mode moves by indentation) only close forms that it is not indented past.
+    """
+    if len(row_stacks.get(row, ())) != depth + 1:
+        return False
+    indent = line_indentation(lines[row])
+    prev_row = row - 1
+    while prev_row in row_stacks and is_blank_or_comment(lines[prev_row], comment_char):
+        prev_row = prev_row - 1
+    if prev_row not in row_stacks or line_indentation(lines[prev_row]) < indent:
+        return False
+    return all(col >= indent for _ch, _row, col in row_stacks[prev_row][depth + 1:])
+
+
+def find_item_window(lines, end_line, cursor_row, enclosing, row_stacks, line_stack,
+                     comment_char, max_lines, max_chars):
+    """
+    Returns (start_row, end_row) of the lines around the cursor that hold
+    whole items of the innermost form that has them, or None if there are no
+    such lines that fit the budget.
+
+    Indent Mode reads the items of a form like top-level forms as long as the
+    window starts on a line that begins an item, no line of code in it is
+    indented less than that line, and the next line of code after it is not
+    indented more (so it closes everything the window opens) but is still
+    inside the form.
+    """
+    if line_stack is None:
+        return None
+    for depth in range(len(enclosing) - 1, -1, -1):
+        _ch, open_row, open_col = enclosing[depth]
+
+        # the rest of the cursor line must not close the form
+        if line_stack[:depth + 1] != enclosing[:depth + 1]:
+            continue
+
+        # the nearest line above the cursor that begins an item of this form
+        start_row = None
+        min_indent = None
+        for row in range(cursor_row, max(open_row, cursor_row - max_lines), -1):
+            line = lines[row]
+            if row not in row_stacks or is_blank_or_comment(line, comment_char):
+                continue
+            indent = line_indentation(line)
+            if ((min_indent is None or indent <= min_indent) and
+                    begins_item(lines, row_stacks, row, depth, comment_char)):
+                start_row = row
+                break
+            if min_indent is None or indent < min_indent:
+                min_indent = indent
+        if start_row is None:
+            continue
+        item_indent = line_indentation(lines[start_row])
+
+        # the window ends before the next line of code indented like an item
+        end_row = cursor_row
+        next_row = cursor_row + 1
+        next_indent = None
+        while next_row < end_line and next_row - start_row < max_lines:
+            line = lines[next_row]
+            if not is_blank_or_comment(line, comment_char):
+                indent = line_indentation(line)
+                if indent <= item_indent:
+                    next_indent = indent
+                    break
+                end_row = next_row
+            next_row = next_row + 1
+
+        # the form closes on the last line, so its items are not enough
+        if next_indent is None or next_indent <= open_col:
+            continue
+
+        if sum(map(len, lines[start_row:end_row + 1])) > max_chars:
+            return None
+        return start_row, end_row
+
+    return None
+
+
+# -----------------------------------------------------------------------------
+# Validation
+# -----------------------------------------------------------------------------
+# Parinfer only looks at the form around the cursor, so once the user stops
+# typing we check the whole buffer with Check Mode and show the first problem
+# in the status bar. The check runs on the async thread in short slices.
+
+# buffer_id -> (change count, Check Mode result)
+validation_results = {}
+
+def show_validation(view, result):
+    if result['success']:
+        view.erase_status(VALIDATION_STATUS_KEY)
+    else:
+        error = result['error']
+        view.set_status(VALIDATION_STATUS_KEY,
+                        'Parinfer: %s (line %d)' % (error['message'], error['lineNo'] + 1))
+
+
+class ValidationJob(object):
+    """
+    Checks the whole buffer of a view, VALIDATION_SLICE_MS at a time. The job
+    stops when is_current() returns False (ie: the buffer was modified).
+    """
+    def __init__(self, view, is_current):
+        self.view = view
+        self.is_current = is_current
+        self.change_count = view.change_count()
+        self.checker = get_engine().Checker({
+            'dialect': get_view_dialect(view),
+            'comment': get_comment_char(view),
+        })
+        self.lines = view.substr(sublime.Region(0, view.size())).split("\n")
+        self.next_line = 0
+
+    def run_slice(self):
+        if not self.is_current() or not self.view.is_valid():
+            return
+
+        lines = self.lines
+        deadline = time.perf_counter() + VALIDATION_SLICE_MS / 1000.0
+        while self.next_line < len(lines):
+            end = min(self.next_line + VALIDATION_SLICE_LINES, len(lines))
+            if self.checker.feed(lines, self.next_line, end) is not None:
+                self.next_line = len(lines)
+                break
+            self.next_line = end
+            if time.perf_counter() > deadline:
+                break
+
+        # yield to other work before the next slice
+        if self.next_line < len(lines):
+            sublime.set_timeout_async(self.run_slice, 0)
+            return
+
+        result = self.checker.finish()
+        validation_results[self.view.buffer_id()] = (self.change_count, result)
+        show_validation(self.view, result)
+
+
+# -----------------------------------------------------------------------------
+# Paren Trees
+# -----------------------------------------------------------------------------
+# The rainbow delimiters and the selection commands use the paren tree
+# (returnParens) of Paren Mode runs on top-level forms. Trees are kept by the
+# text of their form, so a form is only read again once it changes.
+
+class FormTree(object):
+    """
+    The paren tree of the top-level form that starts at point. starts are the
+    offsets of its lines; parens is None if Paren Mode failed on the form (ie:
+    it is not balanced).
+    """
+    def __init__(self, point, starts, parens):
+        self.point = point
+        self.starts = starts
+        self.parens = parens
+
+    def open_point(self, opener):
+        return self.point + self.starts[opener.lineNo] + opener.x
+
+    def close_point(self, opener):
+        return self.point + self.starts[opener.closer['lineNo']] + opener.closer['x']
+
+
+# (dialect, comment char, form text) -> paren tree, most recently used last
+# NOTE: read from the async thread (delimiters) and the main thread (selection
+# commands), so every access holds paren_trees_lock
+paren_trees = collections.OrderedDict()
+paren_trees_lock = threading.Lock()
+
+def read_paren_tree(text, dialect, comment_char):
+    key = (dialect, comment_char, text)
+    with paren_trees_lock:
+        if key in paren_trees:
+            paren_trees.move_to_end(key)
+            return paren_trees[key]
+    options = {
+        'dialect': dialect,
+        'comment': comment_char,
+        'returnParens': True,
+    }
+    result = paren_mode(text, options)
+    parens = result['parens'] if result['success'] and result['text'] == text else None
+    with paren_trees_lock:
+        paren_trees[key] = parens
+        while len(paren_trees) > PAREN_TREE_CACHE_FORMS:
+            paren_trees.popitem(last=False)
+    return parens
+
+def form_trees(view, first_row, last_row):
+    """
+    Returns a FormTree for each top-level form around the rows first_row to
+    last_row, or an empty list if those are more than bounded_mode_max_chars
+    characters.
+    """
+    start_line, end_line = find_parent_expressions_around(view, first_row, last_row)
+    start_point = view.text_point(start_line, 0)
+    text = view.substr(sublime.Region(start_point, view.text_point(end_line, 0)))
+    max_chars = get_setting(view, 'bounded_mode_max_chars')
+    if max_chars and len(text) > max_chars:
+        return []
+
+    dialect = get_view_dialect(view)
+    comment_char = get_comment_char(view)
+    lines = text.split("\n")
+    starts = line_starts(lines)
+    form_rows = [row for row in range(1, len(lines)) if is_parent_expression(lines[row])]
+    trees = []
+    for first, end in zip([0] + form_rows, form_rows + [len(lines)]):
+        parens = read_paren_tree("\n".join(lines[first:end]), dialect, comment_char)
+        form_starts = [start - starts[first] for start in starts[first:end]]
+        trees.append(FormTree(start_point + starts[first], form_starts, parens))
+    return trees
+
+
+# -----------------------------------------------------------------------------
+# Rainbow Delimiters
+# -----------------------------------------------------------------------------
+# Colors the parens on screen by depth and outlines the pair at the cursor,
+# from the paren trees of the top-level forms in view. Typing only reads the
+# form being edited again, and only the regions that changed are drawn again.
+# Sublime Text has no event for scrolling, so the visible region of the active
+# view is checked every DELIMITER_POLL_MS for a while after the last input.
+
+class DelimiterPainter(object):
+    """
+    Draws the delimiters of one view.
+    """
+    def __init__(self, view):
+        self.view = view
+        self.drawn = {}             # region key -> points drawn with it
+        self.pairs = {}             # point of a paren -> point of its match
+        self.change_count = None    # change count of the view when pairs was built
+        self.visible = None
+        self.generation = 0
+        self.polling = False
+        self.idle_polls = 0
+
+    def schedule(self, delay):
+        self.generation = self.generation + 1
+        sublime.set_timeout_async(functools.partial(self.run, self.generation), delay)
+
+    def run(self, generation):
+        if generation == self.generation and self.is_enabled():
+            self.draw()
+
+    def is_enabled(self):
+        return self.view.is_valid() and self.view.get_status(STATUS_KEY) in ALL_STATUSES
+
+    def touch(self):
+        self.idle_polls = 0
+        if not self.polling:
+            self.polling = True
+            sublime.set_timeout_async(self.poll, DELIMITER_POLL_MS)
+
+    def poll(self):
+        view = self.view
+        window = view.window() if view.is_valid() else None
+        if (window is None or window.active_view() != view or not self.is_enabled() or
+                self.idle_polls * DELIMITER_POLL_MS >= DELIMITER_POLL_IDLE_MS):
+            self.polling = False
+            return
+        self.idle_polls = self.idle_polls + 1
+        if view.visible_region() != self.visible:
+            self.idle_polls = 0
+            self.draw()
+        sublime.set_timeout_async(self.poll, DELIMITER_POLL_MS)
+
+    def draw(self):
+        view = self.view
+        self.visible = visible = view.visible_region()
+        self.change_count = view.change_count()
+        scopes = get_setting(view, 'rainbow_delimiter_scopes') or []
+        points = [[] for _scope in scopes]
+        pairs = {}
+        if scopes:
+            first_row = view.rowcol(visible.begin())[0]
+            last_row = view.rowcol(visible.end())[0]
+            for tree in form_trees(view, first_row, last_row):
+                if tree.parens is not None:
+                    self.add_parens(tree, visible, points, pairs)
+
+        self.pairs = pairs
+        for i, scope in enumerate(scopes):
+            self.draw_points(DELIMITER_REGION_KEY % i, points[i], scope,
+                             sublime.DRAW_NO_FILL | sublime.DRAW_NO_OUTLINE | sublime.DRAW_SOLID_UNDERLINE)
+        self.draw_match()
+
+    def add_parens(self, tree, visible, points, pairs):
+        stack = [(opener, 0) for opener in reversed(tree.parens)]
+        while len(stack) > 0:
+            opener, depth = stack.pop()
+            open_point = tree.open_point(opener)
+            close_point = tree.close_point(opener)
+            pairs[open_point] = close_point
+            pairs[close_point] = open_point
+            depth_points = points[depth % len(points)]
+            for point in (open_point, close_point):
+                if visible.begin() <= point < visible.end():
+                    depth_points.append(point)
+            stack.extend((child, depth + 1) for child in reversed(opener.children))
+
+    def draw_match(self):
+        view = self.view
+        points = []
+        selections = view.sel()
+        if self.change_count == view.change_count() and len(selections) > 0 and selections[0].empty():
+            cursor = selections[0].a
+            for point in (cursor - 1, cursor):
+                if point in self.pairs:
+                    points = sorted([point, self.pairs[point]])
+                    break
+        self.draw_points(MATCH_REGION_KEY, points, get_setting(view, 'match_delimiter_scope') or '',
+                         sublime.DRAW_NO_FILL)
+
+    def draw_points(self, key, points, scope, flags):
+        points.sort()
+        if self.drawn.get(key, []) == points:
+            return
+        self.drawn[key] = points
+        if len(points) > 0:
+            self.view.add_regions(key, [sublime.Region(point, point + 1) for point in points],
+                                  scope, '', flags)
+        else:
+            self.view.erase_regions(key)
+
+    def clear(self):
+        for key in self.drawn:
+            self.view.erase_regions(key)
+        self.drawn = {}
+        self.pairs = {}
+        self.generation = self.generation + 1
+
+
+# view_id -> DelimiterPainter
+delimiter_painters = {}
+
+def get_delimiter_painter(view):
+    if not get_setting(view, 'rainbow_delimiters'):
+        return None
+    painter = delimiter_painters.get(view.id())
+    if painter is None:
+        painter = delimiter_painters[view.id()] = DelimiterPainter(view)
+    return painter
+
+
+# -----------------------------------------------------------------------------
+# Structural Selection
+# -----------------------------------------------------------------------------
+# "Parinfer: Expand Selection to Form" grows a selection to the inside of the
+# innermost form around it, then to the whole form, then to the inside of its
+# parent and so on, by walking down the paren tree of its top-level form.
+# "Parinfer: Contract Selection" goes back through those steps.
+
+# view_id -> [(selections before, selections after)] of the expansions
+selection_history = {}
+
+def enclosing_forms(tree, begin, end):
+    """
+    Returns [(open point, close point)] of the forms of tree around the region
+    begin to end, innermost first.
+    """
+    forms = []
+    openers = tree.parens
+    while openers:
+        # the last opener that starts at or before the region
+        lo = 0
+        hi = len(openers)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if tree.open_point(openers[mid]) <= begin:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == 0:
+            break
+        opener = openers[lo - 1]
+        close_point = tree.close_point(opener)
+        if end > close_point + 1:
+            break
+        forms.append((tree.open_point(opener), close_point))
+        openers = opener.children
+    forms.reverse()
+    return forms
+
+def find_form_tree(view, region):
+    """
+    Returns the FormTree of the top-level form that holds region, or None.
+    """
+    first_row = view.rowcol(region.begin())[0]
+    last_row = view.rowcol(region.end())[0]
+    found = None
+    for tree in form_trees(view, first_row, last_row):
+        if tree.point <= region.begin():
+            found = tree
+    return found
+
+def expanded_region(forms, region):
+    for open_point, close_point in forms:
+        for candidate in (sublime.Region(open_point + 1, close_point),
+                          sublime.Region(open_point, close_point + 1)):
+            if candidate.contains(region) and candidate.size() > region.size():
+                return candidate
+    return None
+
+def contracted_region(forms, region):
+    for open_point, close_point in forms:
+        if region == sublime.Region(open_point, close_point + 1):
+            return sublime.Region(open_point + 1, close_point)
+    return None
+
+
+# -----------------------------------------------------------------------------
+# Result Cache
+# -----------------------------------------------------------------------------
+# Undo, redo, toggling modes and going back and forth between forms run the
+# engine on inputs it has seen before, so we keep the most recent results.
+
+# the options that change the result of a run
+RESULT_CACHE_OPTIONS = ('cursorLine', 'cursorX', 'dialect', 'comment', 'returnParens')
+
+class ResultCache(object):
+    """
+    A bounded LRU cache of engine results keyed by the mode, a hash of the
+    text and the options that matter.
+    """
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def run(self, mode, fn, text, options):
+        key = (mode, hashlib.sha1(text.encode('utf-8')).hexdigest(),
+               tuple(options.get(name) for name in RESULT_CACHE_OPTIONS))
+        result = self.entries.get(key)
+        if result is not None:
+            self.hits = self.hits + 1
+            self.entries.move_to_end(key)
+            return result
+
+        self.misses = self.misses + 1
+        result = fn(text, options)
+        self.entries[key] = result
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return result
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+result_cache = ResultCache(0)
+
+def run_engine(view, mode, fn, text, options):
+    """
+    Runs fn (indent_mode or paren_mode) through the result cache and checks
+    how long it took against the latency budget.
+    """
+    started_at = time.perf_counter()
+    cache_hit = False
+    max_entries = get_setting(view, 'result_cache_max_entries')
+    # runs with changes (ie: pasted code) do not come back
+    if not max_entries or 'changes' in options:
+        result = fn(text, options)
+    else:
+        result_cache.max_entries = max_entries
+        hits = result_cache.hits
+        result = result_cache.run(mode, fn, text, options)
+        cache_hit = result_cache.hits != hits
+    seconds = time.perf_counter() - started_at
+    # a cache hit says nothing about how fast the engine is on this view
+    if not cache_hit:
+        check_latency(view, seconds)
+    if recorder is not None:
+        recorder.record_run(view, mode, seconds)
+    return result
+
+
+# -----------------------------------------------------------------------------
+# Latency Budget
+# -----------------------------------------------------------------------------
+# When the engine keeps taking longer than `latency_budget_ms` on a view, every
+# keystroke pays for it. Such views step down to cheaper levels: first Indent
+# Mode only processes a smaller window around the cursor (see Bounded Mode),
+# then we also wait longer for the user to stop typing. Once runs are fast
+# again the view steps back up.
+
+LATENCY_NORMAL = 0
+LATENCY_BOUNDED = 1
+LATENCY_SLOW = 2
+
+class LatencyGuard(object):
+    def __init__(self):
+        self.level = LATENCY_NORMAL
+        self.overruns = 0
+        self.fast_runs = 0
+
+    def record(self, seconds, budget):
+        """
+        Returns the new level when this run changed it, else None.
+        """
+        if seconds > budget:
+            self.fast_runs = 0
+            self.overruns = self.overruns + 1
+            if self.overruns >= LATENCY_OVERRUNS_TO_DOWNGRADE and self.level < LATENCY_SLOW:
+                self.overruns = 0
+                self.level = self.level + 1
+                return self.level
+        elif seconds < budget / 2:
+            self.overruns = 0
+            self.fast_runs = self.fast_runs + 1
+            if self.fast_runs >= LATENCY_FAST_RUNS_TO_RECOVER and self.level > LATENCY_NORMAL:
+                self.fast_runs = 0
+                self.level = self.level - 1
+                return self.level
+        return None
+
+
+# view_id -> LatencyGuard
+latency_guards = {}
+
+LATENCY_NOTICES = {
+    LATENCY_NORMAL: 'Parinfer: back to normal',
+    LATENCY_BOUNDED: 'Parinfer is slow on this file, only processing the code near the cursor',
+    LATENCY_SLOW: 'Parinfer is slow on this file, waiting longer between runs',
+}
+
+def get_latency_level(view):
+    guard = latency_guards.get(view.id())
+    return guard.level if guard is not None else LATENCY_NORMAL
+
+def check_latency(view, seconds):
+    budget_ms = get_setting(view, 'latency_budget_ms')
+    if not budget_ms:
+        return
+    guard = latency_guards.get(view.id())
+    if guard is None:
+        guard = latency_guards[view.id()] = LatencyGuard()
+    level = guard.record(seconds, budget_ms / 1000.0)
+    if level is not None:
+        debug_log("latency: view %d took %.1f ms, now at level %d" % (view.id(), seconds * 1000, level))
+        sublime.status_message(LATENCY_NOTICES[level])
+        if recorder is not None:
+            recorder.record_latency_level(view, level, seconds)
+        if profiler is not None:
+            profiler.note('view %d took %.1f ms, now at latency level %d' % (view.id(), seconds * 1000, level))
+
+
+# -----------------------------------------------------------------------------
+# Paren Mode Cache
+# -----------------------------------------------------------------------------
+# Hashes of texts that Paren Mode does not change, so that opening a file that
+# is already clean does not run Paren Mode over the whole file again. The cache
+# is one JSON file shared by every window (and every running Sublime Text), so
+# writes merge with what is on disk and replace the file atomically.
+
+def clean_text_key(text, dialect, comment_char):
+    text_hash = hashlib.sha1(text.encode('utf-8')).hexdigest()
+    return '%d:%s:%s:%s:%s' % (CLEAN_CACHE_VERSION, get_engine().API['version'], dialect,
+                               comment_char, text_hash)
+
+
+class CleanTextCache(object):
+    """
+    A size-bounded LRU set of clean_text_key()s, stored at path as a JSON
+    object that maps each key to the time it was last used.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.entries = None     # key -> last used (seconds since the epoch)
+        self.touched = {}       # entries used since the last save
+        self.save_scheduled = False
+        self.lock = threading.Lock()
+
+    def read(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+        if not isinstance(entries, dict):
+            return {}
+        return entries
+
+    def touch(self, key):
+        now = time.time()
+        self.entries[key] = now
+        self.touched[key] = now
+        if not self.save_scheduled:
+            self.save_scheduled = True
+            sublime.set_timeout_async(self.save, CLEAN_CACHE_SAVE_DELAY_MS)
+
+    def contains(self, key):
+        with self.lock:
+            if self.entries is None:
+                self.entries = self.read()
+            if key not in self.entries:
+                return False
+            self.touch(key)
+            return True
+
+    def add(self, key):
+        with self.lock:
+            if self.entries is None:
+                self.entries = self.read()
+            self.touch(key)
+
+    def save(self):
+        settings = sublime.load_settings('Parinfer.sublime-settings')
+        max_entries = settings.get('paren_mode_cache_max_entries') or 0
+        with self.lock:
+            self.save_scheduled = False
+
+            # other windows may have written to the file since we read it
+            entries = self.read()
+            for key, last_used in self.touched.items():
+                if entries.get(key, 0) < last_used:
+                    entries[key] = last_used
+            self.touched = {}
+
+            # evict the least recently used entries
+            if len(entries) > max_entries:
+                keep = sorted(entries, key=entries.get, reverse=True)[:max_entries]
+                entries = dict((key, entries[key]) for key in keep)
+            self.entries = entries
+
+            directory = os.path.dirname(self.path)
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(entries, f)
+                os.replace(tmp_path, self.path)
+            except (IOError, OSError):
+                debug_log("could not write the Paren Mode cache")
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+
+clean_text_cache = None
+
+def get_clean_text_cache():
+    global clean_text_cache
+    if clean_text_cache is None:
+        path = os.path.join(sublime.cache_path(), 'Parinfer', CLEAN_CACHE_FILE_NAME)
+        clean_text_cache = CleanTextCache(path)
+    return clean_text_cache
+
+
+# -----------------------------------------------------------------------------
+# Engine Server
+# -----------------------------------------------------------------------------
+# All plugins share the plugin host, so a long Paren Mode run over a whole
+# buffer holds up every other plugin. When `engine_server_python` is set we run
+# those in a `parinfer.py --server` subprocess instead (see parinfer.py for the
+# protocol). The server is started on first use and reused; when it crashes it
+# is restarted on the next request, unless it keeps crashing.
+
+class EngineServer(object):
+    """
+    Client side of the engine server. Callbacks run on the main thread with the
+    result, or with None when the server could not answer (the caller should
+    then run the engine in-process).
+    """
+    def __init__(self, python, script):
+        self.python = python
+        self.script = script
+        self.process = None
+        self.next_id = 0
+        self.callbacks = {}
+        self.crashes = []
+        self.lock = threading.Lock()
+
+    def can_start(self):
+        cutoff = time.time() - ENGINE_SERVER_CRASH_WINDOW_S
+        self.crashes = [t for t in self.crashes if t > cutoff]
+        return len(self.crashes) < ENGINE_SERVER_MAX_CRASHES
+
+    def start(self):
+        startupinfo = None
+        if os.name == 'nt':
+            # do not flash a console window
+            startupinfo = subprocess.STARTUPINFO()
+            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+        process = subprocess.Popen([self.python, '-u', self.script, '--server'],
+                                   stdin=subprocess.PIPE,
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.DEVNULL,
+                                   startupinfo=startupinfo)
+        reader = threading.Thread(target=self.read_responses, args=(process,))
+        reader.daemon = True
+        reader.start()
+        self.process = process
+        debug_log("started engine server, pid " + str(process.pid))
+
+    def read_responses(self, process):
+        for line in process.stdout:
+            try:
+                message = json.loads(line.decode('utf-8'))
+            except ValueError:
+                continue
+            with self.lock:
+                callback = self.callbacks.pop(message.get('id'), None)
+            if callback is not None:
+                sublime.set_timeout(functools.partial(callback, message.get('result')), 0)
+
+        # the process is gone: fail everything it still owed us
+        with self.lock:
+            if self.process is process:
+                self.process = None
+                self.crashes.append(time.time())
+                debug_log("engine server exited with " + str(process.wait()))
+            callbacks = list(self.callbacks.values())
+            self.callbacks.clear()
+        for callback in callbacks:
+            sublime.set_timeout(functools.partial(callback, None), 0)
+
+    def send(self, message):
+        self.process.stdin.write((json.dumps(message) + "\n").encode('utf-8'))
+        self.process.stdin.flush()
+
+    def request(self, mode, text, options, callback):
+        """
+        Sends a request and returns its id, or None when the server cannot be
+        used right now.
+        """
+        with self.lock:
+            if self.process is None:
+                if not self.can_start():
+                    return None
+                try:
+                    self.start()
+                except OSError as e:
+                    debug_log("could not start engine server: " + str(e))
+                    self.crashes.append(time.time())
+                    return None
+
+            self.next_id = self.next_id + 1
+            request_id = self.next_id
+            try:
+                self.send({'id': request_id, 'mode': mode, 'text': text, 'options': options})
+            except OSError:
+                # read_responses notices the exit and counts the crash
+                return None
+            self.callbacks[request_id] = callback
+        return request_id
+
+    def cancel(self, request_id):
+        """
+        The callback of a cancelled request is never called.
+        """
+        with self.lock:
+            if self.callbacks.pop(request_id, None) is None or self.process is None:
+                return
+            try:
+                self.send({'id': request_id, 'cancel': True})
+            except OSError:
+                pass
+
+    def stop(self):
+        with self.lock:
+            process = self.process
+            self.process = None
+            self.callbacks.clear()
+        if process is not None:
+            process.stdin.close()
+            process.terminate()
+
+
+engine_server = None
+
+def get_engine_server(view):
+    """
+    Returns the engine server, or None when it is turned off or unavailable.
+    """
+    global engine_server
+    python = get_setting(view, 'engine_server_python')
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'parinfer.py')
+    # the engine has to be a real file (not inside a .sublime-package archive)
+    if not python or not os.path.isfile(script):
+        return None
+    if engine_server is None or engine_server.python != python:
+        if engine_server is not None:
+            engine_server.stop()
+        engine_server = EngineServer(python, script)
+    if engine_server.process is None and not engine_server.can_start():
+        return None
+    return engine_server
+
+
+def plugin_unloaded():
+    if engine_server is not None:
+        engine_server.stop()
+
+
+# -----------------------------------------------------------------------------
+# Session Recording
+# -----------------------------------------------------------------------------
+# "Parinfer: Start Recording Session" logs what happens in Parinfer views until
+# "Parinfer: Stop Recording Session", so that tools/replay.py can play a real
+# editing session back against the plugin and the engine.
+
+class SessionRecorder(object):
+    """
+    Writes one JSON list per line. Each starts with the event type and the
+    time in milliseconds since the recording started:
+
+      ["v", t, view, file name, status, text]  a view and its text
+      ["c", t, view, a, b, str]                the user replaced [a, b) with str
+      ["p", t, view, a, b, str]                Parinfer replaced [a, b) with str
+      ["s", t, view, [[a, b], ...]]            the selections changed
+      ["m", t, view, status]                   the status (mode) changed
+      ["r", t, view, mode, ms]                 an engine run and how long it took
+      ["l", t, view, level, ms]                the latency level changed after a run of ms
+      ["e", t, view, sha1]                     the text when the recording stopped
+    """
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'w', encoding='utf-8')
+        self.started_at = self.now()
+        self.views = {}
+        self.statuses = {}
+
+    def now(self):
+        return time.perf_counter()
+
+    def write(self, event_type, view, *args):
+        t = round((self.now() - self.started_at) * 1000, 1)
+        self.file.write(json.dumps([event_type, t, view.id()] + list(args), separators=(',', ':')) + "\n")
+
+    def note_status(self, view):
+        status = view.get_status(STATUS_KEY)
+        if self.statuses.get(view.id()) != status:
+            self.statuses[view.id()] = status
+            self.write('m', view, status)
+
+    def add_view(self, view):
+        if view.id() in self.views:
+            return
+        self.views[view.id()] = view
+        self.statuses[view.id()] = view.get_status(STATUS_KEY)
+        self.write('v', view, os.path.basename(view.file_name() or ''), view.get_status(STATUS_KEY),
+                   view.substr(sublime.Region(0, view.size())))
+        self.record_selection(view)
+
+    def record_changes(self, view, changes, applied):
+        if view is None or view.id() not in self.views:
+            return
+        self.note_status(view)
+        for change, is_applied in zip(changes, applied):
+            self.write('p' if is_applied else 'c', view, change.a.pt, change.b.pt, change.str)
+
+    def record_selection(self, view):
+        if view.id() in self.views:
+            self.write('s', view, [[region.a, region.b] for region in view.sel()])
+
+    def record_run(self, view, mode, seconds):
+        if view.id() in self.views:
+            self.note_status(view)
+            self.write('r', view, mode, round(seconds * 1000, 3))
+
+    def record_latency_level(self, view, level, seconds):
+        if view.id() in self.views:
+            self.write('l', view, level, round(seconds * 1000, 3))
+
+    def stop(self):
+        for view in self.views.values():
+            if view.is_valid():
+                text = view.substr(sublime.Region(0, view.size()))
+                self.write('e', view, hashlib.sha1(text.encode('utf-8')).hexdigest())
+        self.file.close()
+
+
+recorder = None
+
+def session_file_path():
+    directory = os.path.join(sublime.cache_path(), 'Parinfer')
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    return os.path.join(directory, time.strftime('session-%Y%m%d-%H%M%S.jsonl'))
+
+
+def start_recording():
+    global recorder
+    recorder = SessionRecorder(session_file_path())
+    for window in sublime.windows():
+        for view in window.views():
+            if view.get_status(STATUS_KEY) in ALL_STATUSES:
+                recorder.add_view(view)
+
+
+def stop_recording():
+    global recorder
+    session = recorder
+    recorder = None
+    session.stop()
+    return session
+
+
+# -----------------------------------------------------------------------------
+# Profiling
+# -----------------------------------------------------------------------------
+# "Parinfer: Start Profiling" swaps the plugin commands and engine entry points
+# for wrappers that run them under cProfile. "Parinfer: Stop Profiling" puts the
+# originals back, so there is no cost when profiling is not running.
+
+class PluginProfiler(object):
+    def __init__(self):
+        self.profile = cProfile.Profile()
+        self.started_at = time.time()
+        self.depth = 0
+        self.calls = {}
+        self.notes = []         # decisions made while profiling (ie: latency levels)
+        self.originals = []
+
+    def wrap(self, name, fn):
+        # only the outermost call turns the profiler on and off
+        def wrapper(*args, **kwargs):
+            self.calls[name] = self.calls.get(name, 0) + 1
+            if self.depth > 0:
+                return fn(*args, **kwargs)
+            self.depth = self.depth + 1
+            self.profile.enable()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.profile.disable()
+                self.depth = self.depth - 1
+        return functools.wraps(fn)(wrapper)
+
+    def install(self, owner, attr, name):
+        original = getattr(owner, attr)
+        self.originals.append((owner, attr, original))
+        setattr(owner, attr, self.wrap(name, original))
+
+    def note(self, text):
+        self.notes.append('%.1fs %s' % (time.time() - self.started_at, text))
+
+    def uninstall(self):
+        for owner, attr, original in reversed(self.originals):
+            setattr(owner, attr, original)
+        self.originals = []
+
+    def summary(self, top_n):
+        stream = io.StringIO()
+        stream.write('Parinfer profile: %.1f seconds\n' % (time.time() - self.started_at))
+        for name in sorted(self.calls):
+            stream.write('  %s: %d calls\n' % (name, self.calls[name]))
+        for text in self.notes:
+            stream.write('  %s\n' % text)
+        stream.write('\n')
+        stats = pstats.Stats(self.profile, stream=stream)
+        stats.sort_stats('cumulative').print_stats(top_n)
+        return stream.getvalue()
+
+
+# the running profiling session (None when profiling is off)
+profiler = None
+
+def start_profiling():
+    global profiler
+    profiler = PluginProfiler()
+    this_module = sys.modules[__name__]
+    profiler.install(ParinferInspectCommand, 'run', 'ParinferInspectCommand.run')
+    profiler.install(ParinferApplyCommand, 'run', 'ParinferApplyCommand.run')
+    profiler.install(this_module, 'indent_mode', 'indent_mode')
+    profiler.install(this_module, 'paren_mode', 'paren_mode')
+
+
+def stop_profiling():
+    global profiler
+    session = profiler
+    profiler = None
+    session.uninstall()
+    return session
+
+
+def profile_file_path():
+    directory = os.path.join(sublime.cache_path(), 'Parinfer')
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    filename = time.strftime('profile-%Y%m%d-%H%M%S.pstats')
+    return os.path.join(directory, filename)
+
+
+# -----------------------------------------------------------------------------
+# Applying Results
+# -----------------------------------------------------------------------------
+# The engine returns the whole text it was given, so we only replace the lines
+# that changed and move the selections by offset.
+
+def changed_lines(old_lines, new_lines):
+    """
+    Returns (first, old_end, new_end) such that only old_lines[first:old_end]
+    changed into new_lines[first:new_end].
+    """
+    # Parinfer does not add or remove lines, so anything else is one big change
+    if len(old_lines) != len(new_lines):
+        return 0, len(old_lines), len(new_lines)
+
+    first = 0
+    end = len(old_lines)
+    while first < end and old_lines[first] == new_lines[first]:
+        first = first + 1
+    while end > first and old_lines[end - 1] == new_lines[end - 1]:
+        end = end - 1
+    return first, end, end
+
+
+def remap_col(old_line, new_line, col):
+    """
+    Where a cursor at col of old_line ends up in new_line: text before the
+    first and after the last changed character stays with the cursor.
+    """
+    max_len = min(len(old_line), len(new_line))
+    prefix = 0
+    while prefix < max_len and old_line[prefix] == new_line[prefix]:
+        prefix = prefix + 1
+    suffix = 0
+    while suffix < max_len - prefix and old_line[-1 - suffix] == new_line[-1 - suffix]:
+        suffix = suffix + 1
+
+    if col <= prefix:
+        return col
+    if col >= len(old_line) - suffix:
+        return col + len(new_line) - len(old_line)
+    return min(col, len(new_line) - suffix)
+
+
 class ParinferApplyCommand(sublime_plugin.TextCommand):
     """
     This command applies the Parinfer changes to the buffer.
     NOTE: this needs to be a separate command from other operations so
     we have an accurate history stack for "undo" and "redo"
     """
-    def run(self, edit, start_line = 0, end_line = 0, cursor_row = 0, cursor_col = 0, result_text = ''):
-        # get the current selection
-        current_selections = [(self.view.rowcol(start), self.view.rowcol(end))
-                              for start, end in self.view.sel()]
+    def run(self, edit, start_line = 0, end_line = 0, cursor_row = None, cursor_col = None,
+            result_cursor_col = None, result_text = ''):
+        current_view = self.view
+        start_point = current_view.text_point(start_line, 0)
+        end_point = current_view.text_point(end_line, 0)
+        old_lines = current_view.substr(sublime.Region(start_point, end_point)).split("\n")
+        new_lines = result_text.split("\n")
+
+        # only replace the lines that changed
+        first, old_end, new_end = changed_lines(old_lines, new_lines)
+        if first == old_end and first == new_end:
+            return
+        old_starts = line_starts(old_lines)
+        new_starts = line_starts(new_lines)
+        change_start = start_point + old_starts[first]
+        change_end = start_point + old_starts[old_end - 1] + len(old_lines[old_end - 1])
+        new_text = "\n".join(new_lines[first:new_end])
+        delta = len(new_text) - (change_end - change_start)
+
+        def remap_point(point):
+            if point <= change_start:
+                return point
+            if point >= change_end:
+                return point + delta
+            # inside the changed lines, keep the row and move the column with the text
+            row = bisect.bisect_right(old_starts, point - start_point) - 1
+            if row >= new_end:
+                return change_start + len(new_text)
+            col = point - start_point - old_starts[row]
+            return start_point + new_starts[row] + remap_col(old_lines[row], new_lines[row], col)
+
+        selections = [sublime.Region(remap_point(region.a), remap_point(region.b))
+                      for region in current_view.sel()]
+
+        # Parinfer knows best where the cursor it ran with goes
+        if cursor_row is not None and result_cursor_col is not None and len(selections) > 0:
+            cursor_line = cursor_row - start_line
+        else:
+            cursor_line = -1
+        if 0 <= cursor_line < min(len(old_lines), len(new_lines)):
+            cursor_point = start_point + old_starts[cursor_line] + cursor_col
+            if current_view.sel()[0] == sublime.Region(cursor_point, cursor_point):
+                new_col = min(result_cursor_col, len(new_lines[cursor_line]))
+                new_point = start_point + new_starts[cursor_line] + new_col
+                selections[0] = sublime.Region(new_point, new_point)
 
         # update the buffer
-        start_point = self.view.text_point(start_line, 0)
-        end_point = self.view.text_point(end_line, 0)
-        region = sublime.Region(start_point, end_point)
-        self.view.replace(edit, region, result_text)
+        applied_changes.setdefault(current_view.buffer_id(), []).append((change_start, change_end, new_text))
+        current_view.replace(edit, sublime.Region(change_start, change_end), new_text)
 
         # re-apply their selection
-        self.view.sel().clear()
-        for start, end in current_selections:
-            self.view.sel().add(
-                sublime.Region(self.view.text_point(*start),
-                               self.view.text_point(*end)))
+        current_view.sel().clear()
+        current_view.sel().add_all(selections)
+
+
+class ParinferIndentCommand(sublime_plugin.TextCommand):
+    """
+    Runs Sublime's indent or unindent command, then Parinfer on the forms
+    around the selection with the indentation changes. In Indent Mode this is
+    Smart Mode, which moves the lines below a shifted line along with it; in
+    Paren Mode the parens stay and the indentation is corrected.
+    """
+    def run(self, _edit, command = 'indent'):
+        current_view = self.view
+        current_status = current_view.get_status(STATUS_KEY)
+        selections = current_view.sel()
+        first_row = current_view.rowcol(selections[0].begin())[0]
+        last_row = current_view.rowcol(selections[-1].end())[0]
+        start_line, end_line = find_parent_expressions_around(current_view, first_row, last_row)
+
+        # the end point moves when the command indents, so it is read each time
+        def region():
+            return sublime.Region(current_view.text_point(start_line, 0),
+                                  current_view.text_point(end_line, 0))
+
+        old_text = current_view.substr(region())
+
+        indenting_views.add(current_view.id())
+        try:
+            current_view.run_command(command)
+        finally:
+            indenting_views.discard(current_view.id())
+
+        text = current_view.substr(region())
+        changes = indentation_changes(old_text, text)
+        if len(changes) == 0:
+            return
+
+        parinfer_options = {
+            'changes': changes,
+            'dialect': get_view_dialect(current_view),
+            'comment': get_comment_char(current_view),
+        }
+        if current_status == PAREN_STATUS:
+            parinfer_options['selectionStartLine'] = first_row - start_line
+            result = run_engine(current_view, 'paren_mode', paren_mode, text, parinfer_options)
+        else:
+            # NOTE: the engine turns Smart Mode off when given a selectionStartLine
+            result = run_engine(current_view, 'smart_mode', smart_mode, text, parinfer_options)
+
+        if not result['success']:
+            debug_log("Parinfer failed after indenting: " + result['error']['message'])
+            return
+        if result['text'] != text:
+            current_view.run_command('parinfer_apply', {
+                'start_line': start_line,
+                'end_line': end_line,
+                'result_text': result['text'],
+            })
 
 
 class ParinferInspectCommand(sublime_plugin.TextCommand):
@@ -142,7 +1923,8 @@ class ParinferInspectCommand(sublime_plugin.TextCommand):
 
         # holds the text of the last update
         self.last_update_text = None
-        self.comment_char = get_comment_char(self.view)
+        self.comment_char = None
+        self.dialect = None
 
     def run(self, _edit):
         current_view = self.view
@@ -152,57 +1934,296 @@ class ParinferInspectCommand(sublime_plugin.TextCommand):
         if current_status not in ALL_STATUSES:
             return
 
-        whole_region = sublime.Region(0, current_view.size())
-        all_text = current_view.substr(whole_region)
-        lines = all_text.split("\n")
-        # add a newline at the end of the file if there is not one
-        if lines[-1] != "":
-            lines.append("")
+        # NOTE: Sublime Text makes this command for every view, so we only look
+        # these up once Parinfer runs (and the syntax can change in between)
+        self.comment_char = get_comment_char(current_view)
+        self.dialect = get_view_dialect(current_view)
 
         selections = current_view.sel()
         first_cursor = selections[0].begin()
         cursor_row, cursor_col = current_view.rowcol(first_cursor)
-        start_line = find_start_parent_expression(lines, cursor_row)
-        end_line = find_end_parent_expression(lines, cursor_row)
+
+        # pasted code keeps its parens
+        pasted = pasted_code.pop(current_view.buffer_id(), None)
+        if pasted is not None and get_setting(current_view, 'paren_mode_on_paste'):
+            if self.run_pasted(pasted, cursor_row, cursor_col):
+                return
+
+        # let the syntax find the parent expression, or fall back to the text
+        lines = None
+        bounds = find_scoped_parent_expressions(current_view, cursor_row)
+        if bounds is not None:
+            start_line, end_line = bounds
+        else:
+            lines = buffer_lines(current_view)
+            start_line = find_start_parent_expression(lines, cursor_row)
+            end_line = find_end_parent_expression(lines, cursor_row)
         start_point = current_view.text_point(start_line, 0)
         end_point = current_view.text_point(end_line, 0)
         region = sublime.Region(start_point, end_point)
         text = current_view.substr(region)
         modified_cursor_row = cursor_row - start_line
 
+        # only process the form around the cursor when the top-level form is huge
+        if current_status == INDENT_STATUS and self.run_bounded(lines, start_line, end_line, cursor_row, cursor_col, text):
+            return
+
         # exit early if there has been no change since our last update
-        if text == self.last_update_text:
+        if self.is_up_to_date(text, (cursor_row, cursor_col)):
+            return
+
+        # exit early if this form failed before and has not been changed since
+        form_error = form_errors.get(current_view.buffer_id())
+        if form_error is not None and form_error.is_same_run(current_status, text, start_line):
             return
 
         parinfer_options = {
             'cursorLine': modified_cursor_row,
             'cursorX': cursor_col,
-            'commentChar': self.comment_char,
+            'dialect': self.dialect,
+            'comment': self.comment_char,
         }
 
         # specify the Parinfer mode
+        parinfer_mode = 'indent_mode'
         parinfer_fn = indent_mode
         if current_status == PAREN_STATUS:
             # TODO: add parinfer_options.cursorDx here
+            parinfer_mode = 'paren_mode'
             parinfer_fn = paren_mode
 
         # run Parinfer on the text
-        result = parinfer_fn(text, parinfer_options)
+        result = run_engine(current_view, parinfer_mode, parinfer_fn, text, parinfer_options)
 
         if result['success']:
             # save the text of this update so we don't have to process it again
-            self.last_update_text = result['text']
+            if parinfer_fn == indent_mode:
+                trail_rows = set(start_line + trail['lineNo'] for trail in result['parenTrails'])
+                self.remember_result(result['text'], text, start_line, end_line, (cursor_row, cursor_col), trail_rows)
+            else:
+                self.last_update_text = result['text']
+                last_results.pop(current_view.id(), None)
+
+            # ie: the form failed in the other mode
+            if form_error is not None and form_error.start_line == start_line:
+                clear_form_error(current_view.buffer())
 
             # update the buffer in a separate command if the text needs to be changed
             if result['text'] != text:
                 cmd_options = {
                     'cursor_row': cursor_row,
                     'cursor_col': cursor_col,
+                    'result_cursor_col': result.get('cursorX'),
                     'start_line': start_line,
                     'end_line': end_line,
                     'result_text': result['text'],
                 }
                 sublime.set_timeout(lambda: current_view.run_command('parinfer_apply', cmd_options), 1)
+        else:
+            debug_log("Parinfer failed: " + result['error']['message'])
+            show_form_error(current_view, FormError(result['error'], current_status, text, start_line, end_line))
+
+    def run_bounded(self, lines, start_line, end_line, cursor_row, cursor_col, text):
+        """
+        Runs Indent Mode on the largest form around the cursor (or else on
+        the items of a form around the cursor) that fits the bounded mode
+        budget. Returns False if the whole top-level form should be processed
+        instead.
+        """
+        current_view = self.view
+        max_lines = get_setting(current_view, 'bounded_mode_max_lines')
+        max_chars = get_setting(current_view, 'bounded_mode_max_chars')
+        if not max_lines or not max_chars:
+            return False
+        if get_latency_level(current_view) >= LATENCY_BOUNDED:
+            max_lines = max(1, max_lines // LATENCY_BOUNDED_DIVISOR)
+            max_chars = max(1, max_chars // LATENCY_BOUNDED_DIVISOR)
+        if end_line - start_line <= max_lines and len(text) <= max_chars:
+            return False
+        if lines is None:
+            lines = buffer_lines(current_view)
+
+        cache = get_form_scan_cache(current_view.buffer_id(), start_line)
+        scan = read_to_cursor(lines, cursor_row, cursor_col, cache, self.dialect, self.comment_char)
+        if scan is None:
+            debug_log("bounded mode: the parens and indentation do not agree, process the whole form")
+            return False
+        enclosing, row_stacks, line_stack = scan
+
+        window = find_bounded_window(lines, end_line, cursor_row, enclosing, get_dialect(self.dialect),
+                                     self.comment_char, max_lines, max_chars)
+        if window is not None:
+            return self.run_bounded_form(lines, window, cursor_row, cursor_col)
+
+        # ie: the cursor is directly inside a huge vector or map
+        window = find_item_window(lines, end_line, cursor_row, enclosing, row_stacks, line_stack,
+                                  self.comment_char, max_lines, max_chars)
+        if window is not None:
+            return self.run_bounded_items(lines, window, cursor_row, cursor_col)
+
+        debug_log("bounded mode: no form fits the budget, process the whole form")
+        return False
+
+    def run_bounded_form(self, lines, window, cursor_row, cursor_col):
+        current_view = self.view
+        open_row, open_col, end_row, outer_closers = window
+
+        # hide the text before the open paren so the form is top-level in the window
+        first_line = lines[open_row]
+        window_text = "\n".join([' ' * open_col + first_line[open_col:]] + lines[open_row + 1:end_row + 1])
+
+        # tabs are converted to spaces, so the columns we found would not line up
+        if "\t" in window_text:
+            return False
+
+        # exit early if there has been no change since our last update
+        if self.is_up_to_date(window_text, (cursor_row, cursor_col)):
+            return True
+
+        parinfer_options = {
+            'cursorLine': cursor_row - open_row,
+            'cursorX': cursor_col,
+            'dialect': self.dialect,
+            'comment': self.comment_char,
+            'returnParens': True,
+        }
+        result = run_engine(current_view, 'indent_mode', indent_mode, window_text, parinfer_options)
+
+        # the window must still hold exactly one form that closes at the end of its last line
+        if not result['success'] or len(result['parens']) != 1:
+            return False
+        out_lines = result['text'].split("\n")
+        closer = result['parens'][0].closer
+        if closer['lineNo'] != len(out_lines) - 1:
+            return False
+        if not is_blank_or_comment(out_lines[-1][closer['x'] + 1:], self.comment_char):
+            return False
+
+        # put back the close parens of the outer forms and the hidden text
+        last_line = out_lines[-1]
+        out_lines[-1] = last_line[:closer['x'] + 1] + outer_closers + last_line[closer['x'] + 1:]
+        trail_rows = set(open_row + trail['lineNo'] for trail in result['parenTrails'])
+        trail_rows.add(end_row)
+        self.remember_result("\n".join(out_lines), window_text, open_row, end_row + 1,
+                             (cursor_row, cursor_col), trail_rows)
+        out_lines[0] = first_line[:open_col] + out_lines[0][open_col:]
+
+        self.apply_bounded(lines, "\n".join(out_lines), open_row, end_row,
+                           cursor_row, cursor_col, result)
+        return True
+
+    def run_bounded_items(self, lines, window, cursor_row, cursor_col):
+        current_view = self.view
+        start_row, end_row = window
+        window_text = "\n".join(lines[start_row:end_row + 1])
+        if "\t" in window_text:
+            return False
+
+        # exit early if there has been no change since our last update
+        if self.is_up_to_date(window_text, (cursor_row, cursor_col)):
+            return True
+
+        parinfer_options = {
+            'cursorLine': cursor_row - start_row,
+            'cursorX': cursor_col,
+            'dialect': self.dialect,
+            'comment': self.comment_char,
+        }
+        result = run_engine(current_view, 'indent_mode', indent_mode, window_text, parinfer_options)
+        if not result['success']:
+            # the items see the same parens as the whole form, so a close paren
+            # that does not match fails it the same way
+            if result['error']['name'] != get_engine().ERROR_UNMATCHED_CLOSE_PAREN:
+                return False
+            debug_log("Parinfer failed: " + result['error']['message'])
+            show_form_error(current_view, FormError(result['error'], INDENT_STATUS, window_text,
+                                                    start_row, end_row + 1))
+            return True
+
+        trail_rows = set(start_row + trail['lineNo'] for trail in result['parenTrails'])
+        self.remember_result(result['text'], window_text, start_row, end_row + 1,
+                             (cursor_row, cursor_col), trail_rows)
+        self.apply_bounded(lines, result['text'], start_row, end_row,
+                           cursor_row, cursor_col, result)
+        return True
+
+    def apply_bounded(self, lines, result_text, start_row, end_row, cursor_row, cursor_col, result):
+        current_view = self.view
+        # NOTE: buffer_lines adds an empty last line when the file does not end
+        # with a newline, so ask the view whether there is one after end_row
+        line_ending = "\n" if end_row < current_view.rowcol(current_view.size())[0] else ""
+        result_text += line_ending
+        if result_text != "\n".join(lines[start_row:end_row + 1]) + line_ending:
+            cmd_options = {
+                'cursor_row': cursor_row,
+                'cursor_col': cursor_col,
+                'result_cursor_col': result.get('cursorX'),
+                'start_line': start_row,
+                'end_line': end_row + 1,
+                'result_text': result_text,
+            }
+            sublime.set_timeout(lambda: current_view.run_command('parinfer_apply', cmd_options), 1)
+
+    def run_pasted(self, pasted, cursor_row, cursor_col):
+        """
+        Runs Paren Mode once on the forms around code that was just pasted.
+        Returns False if the usual run should happen instead (ie: the pasted
+        code does not have balanced parens).
+        """
+        current_view = self.view
+        start_line, end_line = find_parent_expressions_around(current_view, pasted.start_row, pasted.end_row)
+        start_point = current_view.text_point(start_line, 0)
+        end_point = current_view.text_point(end_line, 0)
+        text = current_view.substr(sublime.Region(start_point, end_point))
+
+        parinfer_options = {
+            'changes': [pasted.engine_change(start_line)],
+            'dialect': self.dialect,
+            'comment': self.comment_char,
+        }
+        if start_line <= cursor_row < end_line:
+            parinfer_options['cursorLine'] = cursor_row - start_line
+            parinfer_options['cursorX'] = cursor_col
+        result = run_engine(current_view, 'paren_mode', paren_mode, text, parinfer_options)
+        if not result['success']:
+            debug_log("Paren Mode failed on the pasted code: " + result['error']['message'])
+            return False
+
+        self.last_update_text = result['text']
+        last_results.pop(current_view.id(), None)
+        if result['text'] != text:
+            cmd_options = {
+                'cursor_row': cursor_row,
+                'cursor_col': cursor_col,
+                'result_cursor_col': result.get('cursorX'),
+                'start_line': start_line,
+                'end_line': end_line,
+                'result_text': result['text'],
+            }
+            sublime.set_timeout(lambda: current_view.run_command('parinfer_apply', cmd_options), 1)
+        return True
+
+    def is_up_to_date(self, text, cursor):
+        """
+        Returns True if running Parinfer on text with the cursor at cursor
+        would not change anything since our last update.
+        """
+        if text != self.last_update_text:
+            return False
+        last_result = last_results.get(self.view.id())
+        if last_result is not None:
+            if cursor != last_result.cursor and last_result.cursor_matters(cursor[0]):
+                return False
+            # the buffer matches the last result now
+            last_result.change_count = self.view.change_count()
+        return True
+
+    def remember_result(self, result_text, text, start_line, end_line, cursor, trail_rows):
+        self.last_update_text = result_text
+        last_result = LastResult(start_line, end_line, cursor, trail_rows)
+        if result_text == text:
+            last_result.change_count = self.view.change_count()
+        last_results[self.view.id()] = last_result
 
 
 class Parinfer(sublime_plugin.EventListener):
@@ -214,6 +2235,19 @@ class Parinfer(sublime_plugin.EventListener):
 
         self.buffers_with_modifications = {}
 
+        # views that have loaded but have not been activated yet, and a
+        # priority queue of (priority, sequence, view_id) to work through them
+        self.pending_activations = {}
+        self.activation_queue = []
+        self.activation_sequence = 0
+        self.activation_scheduled = False
+
+        # background views that still need to run Paren Mode when first focused
+        self.deferred_paren_mode = set()
+
+        # view_id -> number of the latest scheduled validation of that view
+        self.validation_generations = {}
+
     # Should we automatically start Parinfer on this file?
     def should_start(self, view):
         # False if filename is not a string
@@ -253,9 +2287,56 @@ class Parinfer(sublime_plugin.EventListener):
             view.set_status(STATUS_KEY, INDENT_STATUS)
 
         # run Parinfer
+        debounce_ms = DEBOUNCE_INTERVAL_MS
+        if get_latency_level(view) >= LATENCY_SLOW:
+            debounce_ms = SLOW_DEBOUNCE_INTERVAL_MS
         self.pending = self.pending + 1
         sublime.set_timeout(
-            functools.partial(self.handle_timeout, view), DEBOUNCE_INTERVAL_MS)
+            functools.partial(self.handle_timeout, view), debounce_ms)
+
+        self.schedule_validation(view)
+        self.schedule_delimiters(view, debounce_ms + DELIMITER_DELAY_MS)
+
+    # draw the delimiters again once Parinfer has run
+    def schedule_delimiters(self, view, delay):
+        painter = get_delimiter_painter(view)
+        if painter is not None:
+            painter.schedule(delay)
+            painter.touch()
+
+    # check the whole buffer once there has been no input for a while
+    def schedule_validation(self, view):
+        delay = get_setting(view, 'validate_when_idle_ms')
+        if not delay:
+            return
+        view_id = view.id()
+        generation = self.validation_generations.get(view_id, 0) + 1
+        self.validation_generations[view_id] = generation
+        sublime.set_timeout_async(functools.partial(self.start_validation, view, generation), delay)
+
+    def start_validation(self, view, generation):
+        view_id = view.id()
+        is_current = lambda: self.validation_generations.get(view_id) == generation
+        if not is_current() or not view.is_valid():
+            return
+        if view.get_status(STATUS_KEY) not in ALL_STATUSES:
+            return
+
+        # the result holds until the next modification
+        cached = validation_results.get(view.buffer_id())
+        if cached is not None and cached[0] == view.change_count():
+            show_validation(view, cached[1])
+            return
+
+        ValidationJob(view, is_current).run_slice()
+
+    # indent and unindent run in ParinferIndentCommand while Parinfer is on
+    def on_text_command(self, view, command_name, args):
+        if command_name not in ('indent', 'unindent') or view.id() in indenting_views:
+            return None
+        if view.get_status(STATUS_KEY) not in (INDENT_STATUS, PAREN_STATUS):
+            return None
+        return ('parinfer_indent', {'command': command_name})
 
     # fires everytime a selection changes (ie: the cursor is moved)
     def on_selection_modified(self, view):
@@ -264,37 +2345,173 @@ class Parinfer(sublime_plugin.EventListener):
         if status not in ALL_STATUSES:
             return
 
+        if recorder is not None:
+            recorder.record_selection(view)
+
+        painter = get_delimiter_painter(view)
+        if painter is not None:
+            painter.draw_match()
+            painter.touch()
+
         # run Parinfer if this is a buffer that has been modified
         buffer_id = view.buffer_id()
         if buffer_id in self.buffers_with_modifications and self.buffers_with_modifications[buffer_id] == True:
+            if status == INDENT_STATUS and not cursor_move_needs_run(view):
+                debug_log("selection change, cursor cannot change the result, do nothing")
+                return
             debug_log("selection change, buffer has been modified, run Parinfer")
             self.on_modified(view)
         else:
             debug_log("selection change, buffer has NOT been modified, do nothing")
 
-    # fires when a file is finished loading
-    def on_load(self, view):
+    def activation_priority(self, view):
+        window = view.window()
+        if window is None:
+            return BACKGROUND_VIEW_PRIORITY
+        if window.active_view() == view:
+            return ACTIVE_VIEW_PRIORITY
+        for group in range(window.num_groups()):
+            if window.active_view_in_group(group) == view:
+                return VISIBLE_VIEW_PRIORITY
+        return BACKGROUND_VIEW_PRIORITY
+
+    # queue a newly loaded view; the work happens later in drain_activation_queue
+    def queue_activation(self, view):
+        view_id = view.id()
+        self.pending_activations[view_id] = view
+        self.activation_sequence = self.activation_sequence + 1
+        heapq.heappush(self.activation_queue,
+                       (self.activation_priority(view), self.activation_sequence, view_id))
+
+        if not self.activation_scheduled:
+            self.activation_scheduled = True
+            sublime.set_timeout_async(self.drain_activation_queue, ACTIVATION_INTERVAL_MS)
+
+    # handles one queued view per tick so we yield back to Sublime between views
+    def drain_activation_queue(self):
+        self.activation_scheduled = False
+
+        while len(self.activation_queue) > 0:
+            priority, _sequence, view_id = heapq.heappop(self.activation_queue)
+            view = self.pending_activations.pop(view_id, None)
+            # skip views that were closed or already activated
+            if view is None or not view.is_valid():
+                continue
+
+            if priority == BACKGROUND_VIEW_PRIORITY:
+                self.activate(view, run_paren_mode=False)
+            else:
+                self.activate(view)
+            # the view in front may have been focused before it was loaded
+            if priority == ACTIVE_VIEW_PRIORITY:
+                self.on_activated_async(view)
+            break
+
+        if len(self.activation_queue) > 0:
+            self.activation_scheduled = True
+            sublime.set_timeout_async(self.drain_activation_queue, ACTIVATION_INTERVAL_MS)
+
+    # starts Parinfer on a view if it has a known file extension
+    def activate(self, view, run_paren_mode=True):
         if self.should_start(view):
             debug_log("File has been loaded, automatically start Parinfer")
 
             run_paren_mode_on_open = get_setting(view, "run_paren_mode_when_file_opened")
-            if run_paren_mode_on_open == True:
+            if run_paren_mode_on_open == True and run_paren_mode:
                 view.run_command('parinfer_run_paren_current_buffer', { 'drop_into_indent_mode_after': True })
             else:
                 # start Waiting mode
                 view.set_status(STATUS_KEY, PENDING_STATUS)
+
+                # remember to run Paren Mode once this background view is focused
+                if run_paren_mode_on_open == True:
+                    self.deferred_paren_mode.add(view.id())
+
+            if recorder is not None:
+                recorder.add_view(view)
         else:
             debug_log("File has been loaded, but do not start Parinfer")
 
+    # fires when a file is finished loading
+    # NOTE: activation is deferred so that opening many files at once (ie: session
+    # restore) does not stall on running Parinfer for every one of them
+    def on_load(self, view):
+        self.queue_activation(view)
+
+    # fires when a view gains focus
+    def on_activated_async(self, view):
+        view_id = view.id()
+
+        # activate right away instead of waiting for our turn in the queue
+        if self.pending_activations.pop(view_id, None) is not None:
+            self.activate(view)
+
+        elif view_id in self.deferred_paren_mode:
+            self.deferred_paren_mode.discard(view_id)
+            if view.get_status(STATUS_KEY) == PENDING_STATUS:
+                view.run_command('parinfer_run_paren_current_buffer', { 'drop_into_indent_mode_after': True })
+
+        # background tabs are only checked once they are focused (or modified)
+        if view.get_status(STATUS_KEY) in ALL_STATUSES:
+            self.schedule_validation(view)
+            self.schedule_delimiters(view, 0)
+
     # called when a view is closed
     def on_close(self, view):
         buffer_id = view.buffer_id()
         clones = view.clones()
 
+        self.pending_activations.pop(view.id(), None)
+        self.deferred_paren_mode.discard(view.id())
+        last_results.pop(view.id(), None)
+        self.validation_generations.pop(view.id(), None)
+        latency_guards.pop(view.id(), None)
+        delimiter_painters.pop(view.id(), None)
+        selection_history.pop(view.id(), None)
+
         # clear the buffers_with_modifications cache if this is the last view into that Buffer
         if len(clones) == 0 and buffer_id in self.buffers_with_modifications:
             del self.buffers_with_modifications[buffer_id]
 
+        if len(clones) == 0:
+            form_scan_caches.pop(buffer_id, None)
+            form_errors.pop(buffer_id, None)
+            validation_results.pop(buffer_id, None)
+            pasted_code.pop(buffer_id, None)
+            applied_changes.pop(buffer_id, None)
+
+class ParinferTextChangeListener(sublime_plugin.TextChangeListener):
+    """
+    Notes pasted code, and drops the bounded mode scanner checkpoints and the
+    error that a change may have invalidated.
+    """
+    def on_text_changed(self, changes):
+        buffer_id = self.buffer.id()
+        applied = [is_applied_change(buffer_id, change) for change in changes]
+        if recorder is not None:
+            recorder.record_changes(self.buffer.primary_view(), changes, applied)
+
+        # any other change moves the pasted code or makes it an ordinary edit
+        if len(changes) == 1 and not applied[0] and is_pasted_code(changes[0]):
+            pasted_code[buffer_id] = PastedCode(changes[0])
+        else:
+            pasted_code.pop(buffer_id, None)
+
+        cache = form_scan_caches.get(self.buffer.id())
+        if cache is not None and len(changes) > 0:
+            cache.invalidate_from(min(change.a.row for change in changes))
+
+        form_error = form_errors.get(self.buffer.id())
+        if form_error is not None:
+            for change in changes:
+                if change.b.row < form_error.start_line:
+                    # the change is above the form, so the error only moves
+                    form_error.shift(change.str.count("\n") - (change.b.row - change.a.row))
+                elif change.a.row < form_error.end_line:
+                    clear_form_error(self.buffer)
+                    break
+
+
 class ParinferToggleOnCommand(sublime_plugin.TextCommand):
     def run(self, _edit):
         # update the status bar
@@ -304,45 +2521,245 @@ class ParinferToggleOnCommand(sublime_plugin.TextCommand):
         else:
             self.view.set_status(STATUS_KEY, INDENT_STATUS)
 
+        painter = get_delimiter_painter(self.view)
+        if painter is not None:
+            painter.schedule(0)
+
 
 class ParinferToggleOffCommand(sublime_plugin.TextCommand):
     def run(self, _edit):
         # remove from the status bar
         self.view.erase_status(STATUS_KEY)
+        self.view.erase_status(VALIDATION_STATUS_KEY)
+        clear_form_error(self.view.buffer())
+        painter = delimiter_painters.get(self.view.id())
+        if painter is not None:
+            painter.clear()
 
 
 class ParinferRunParenCurrentBuffer(sublime_plugin.TextCommand):
     """
     Runs paren_mode on the entire current buffer
     """
+    # id of the engine server request that is still running for this view
+    server_request = None
+
     def run(self, _edit, drop_into_indent_mode_after = False):
         current_view = self.view
         whole_region = sublime.Region(0, current_view.size())
         all_text = current_view.substr(whole_region)
 
-        lines = all_text.split("\n")
-        # add a newline at the end of the file if there is not one
-        if lines[-1] != "":
-            lines.append("")
+        # count a newline at the end of the file if there is not one
+        end_line = all_text.count("\n")
+        if not all_text.endswith("\n"):
+            end_line += 1
+
+        dialect = get_view_dialect(self.view)
+        comment_char = get_comment_char(self.view)
+
+        # skip Paren Mode if we know that it would not change anything
+        clean_text_cache = None
+        if get_setting(current_view, 'paren_mode_cache_max_entries'):
+            clean_text_cache = get_clean_text_cache()
+            if clean_text_cache.contains(clean_text_key(all_text, dialect, comment_char)):
+                debug_log("Paren Mode cache hit, buffer is already clean")
+                clear_form_error(current_view.buffer())
+                if drop_into_indent_mode_after == True:
+                    current_view.set_status(STATUS_KEY, INDENT_STATUS)
+                return
+
+        options = {
+            'dialect': dialect,
+            'comment': comment_char,
+        }
 
-        result = paren_mode(all_text, { 'comment': get_comment_char(self.view) })
+        # a newer run replaces the one in flight
+        server = get_engine_server(current_view)
+        if server is not None and self.server_request is not None:
+            server.cancel(self.server_request)
+            self.server_request = None
+
+        if server is not None:
+            callback = functools.partial(self.on_server_result, current_view.change_count(),
+                                         all_text, end_line, options, clean_text_cache,
+                                         drop_into_indent_mode_after)
+            self.server_request = server.request('paren_mode', all_text, options, callback)
+            if self.server_request is not None:
+                return
+
+        result = paren_mode(all_text, options)
+        self.apply_result(result, all_text, end_line, options, clean_text_cache, drop_into_indent_mode_after)
+
+    def on_server_result(self, change_count, all_text, end_line, options, clean_text_cache,
+                         drop_into_indent_mode_after, result):
+        self.server_request = None
+        if not self.view.is_valid():
+            return
+        # the result is for text the buffer no longer has, so run again on what
+        # it has now (and still drop into Indent Mode afterward)
+        if self.view.change_count() != change_count:
+            self.view.run_command('parinfer_run_paren_current_buffer', {
+                'drop_into_indent_mode_after': drop_into_indent_mode_after,
+            })
+            return
+        if result is None:
+            result = paren_mode(all_text, options)
+        self.apply_result(result, all_text, end_line, options, clean_text_cache, drop_into_indent_mode_after)
 
+    def apply_result(self, result, all_text, end_line, options, clean_text_cache, drop_into_indent_mode_after):
+        current_view = self.view
         if result['success']:
-            cmd_options = {
-                'start_line': 0, ## first line
-                'end_line': len(lines) - 1, ## last line
-                'result_text': result['text'],
-            }
-            ## apply their change to the buffer
-            current_view.run_command('parinfer_apply', cmd_options)
+            clear_form_error(current_view.buffer())
+            if clean_text_cache is not None:
+                clean_text_cache.add(clean_text_key(result['text'], options['dialect'], options['comment']))
+            ## apply their change to the buffer (the engine hands back the
+            ## text it was given when nothing changed)
+            if result['text'] != all_text:
+                cmd_options = {
+                    'start_line': 0, ## first line
+                    'end_line': end_line, ## last line
+                    'result_text': result['text'],
+                }
+                current_view.run_command('parinfer_apply', cmd_options)
 
             ## optionally drop them into Indent Mode afterward
             if drop_into_indent_mode_after == True:
                 current_view.set_status(STATUS_KEY, INDENT_STATUS)
 
         else:
-            ## TODO: it would be nice to show them the line number / character where this failed
-            sublime.status_message('Paren mode failed. Do you have unbalanced parens?')
+            error = result['error']
+            show_form_error(current_view, FormError(error, PAREN_STATUS, all_text, 0, end_line))
+            sublime.status_message('Paren mode failed on line %d: %s' % (error['lineNo'] + 1, error['message']))
+
+
+class ParinferExpandSelectionCommand(sublime_plugin.TextCommand):
+    """
+    Expands each selection to the inside of the form around it, or to the
+    whole form if it already is the inside.
+    """
+    def run(self, _edit):
+        current_view = self.view
+        before = [(region.a, region.b) for region in current_view.sel()]
+        regions = []
+        for region in current_view.sel():
+            tree = find_form_tree(current_view, region)
+            if tree is None or tree.parens is None:
+                sublime.status_message('Parinfer: cannot read the form around the selection')
+                return
+            expanded = expanded_region(enclosing_forms(tree, region.begin(), region.end()), region)
+            regions.append(expanded if expanded is not None else region)
+
+        current_view.sel().clear()
+        current_view.sel().add_all(regions)
+        after = [(region.a, region.b) for region in current_view.sel()]
+        if after != before:
+            selection_history.setdefault(current_view.id(), []).append((before, after))
+
+
+class ParinferContractSelectionCommand(sublime_plugin.TextCommand):
+    """
+    Undoes the last "Parinfer: Expand Selection to Form", or shrinks a
+    selection of a whole form to its inside.
+    """
+    def run(self, _edit):
+        current_view = self.view
+        current = [(region.a, region.b) for region in current_view.sel()]
+        history = selection_history.get(current_view.id(), [])
+        if len(history) > 0 and history[-1][1] == current:
+            before, _after = history.pop()
+            regions = [sublime.Region(a, b) for a, b in before]
+        else:
+            selection_history.pop(current_view.id(), None)
+            regions = []
+            for region in current_view.sel():
+                tree = find_form_tree(current_view, region)
+                contracted = None
+                if tree is not None and tree.parens is not None:
+                    contracted = contracted_region(enclosing_forms(tree, region.begin(), region.end()), region)
+                regions.append(contracted if contracted is not None else region)
+
+        current_view.sel().clear()
+        current_view.sel().add_all(regions)
+
+
+class ParinferShowResultCacheStatsCommand(sublime_plugin.WindowCommand):
+    """
+    Shows how often the result cache saved running the engine.
+    """
+    def run(self):
+        sublime.status_message('Parinfer result cache: %d hits, %d misses (%.0f%% hit rate), %d entries' % (
+            result_cache.hits, result_cache.misses, result_cache.hit_rate() * 100, len(result_cache.entries)))
+
+
+class ParinferShowStartupTimesCommand(sublime_plugin.WindowCommand):
+    """
+    Shows how long it took to import the plugin and the engine, and how long
+    the first run of the engine took (not counting the import).
+    """
+    def run(self):
+        def ms(name):
+            if name not in startup_times:
+                return 'not yet'
+            return '%.1f ms' % (startup_times[name] * 1000)
+        sublime.status_message('Parinfer startup: plugin import %s, engine import %s, first run %s' % (
+            ms('plugin_import'), ms('engine_import'), ms('first_run')))
+
+
+class ParinferStartRecordingCommand(sublime_plugin.WindowCommand):
+    """
+    Starts recording edits, selections and engine runs in Parinfer views
+    (including their text) for tools/replay.py.
+    """
+    def run(self):
+        start_recording()
+        sublime.status_message('Parinfer: recording started')
+
+    def is_enabled(self):
+        return recorder is None
+
+
+class ParinferStopRecordingCommand(sublime_plugin.WindowCommand):
+    """
+    Stops recording and saves the session.
+    """
+    def run(self):
+        session = stop_recording()
+        sublime.status_message('Parinfer: session saved to ' + session.path)
+
+    def is_enabled(self):
+        return recorder is not None
+
+
+class ParinferStartProfilingCommand(sublime_plugin.WindowCommand):
+    """
+    Starts collecting a cProfile profile of Parinfer while you edit.
+    """
+    def run(self):
+        start_profiling()
+        sublime.status_message('Parinfer: profiling started')
+
+    def is_enabled(self):
+        return profiler is None
+
+
+class ParinferStopProfilingCommand(sublime_plugin.WindowCommand):
+    """
+    Stops profiling, saves the stats to a .pstats file and shows a summary
+    in an output panel.
+    """
+    def run(self):
+        session = stop_profiling()
+
+        path = profile_file_path()
+        session.profile.dump_stats(path)
+        summary = session.summary(PROFILE_TOP_N)
+
+        panel = self.window.create_output_panel(PROFILE_PANEL_NAME)
+        panel.run_command('append', {'characters': 'Saved to ' + path + '\n\n' + summary})
+        self.window.run_command('show_panel', {'panel': 'output.' + PROFILE_PANEL_NAME})
+
+    def is_enabled(self):
+        return profiler is not None
 
 
 class ParinferUndoListener(sublime_plugin.EventListener):
@@ -367,3 +2784,6 @@ class ParinferUndoListener(sublime_plugin.EventListener):
             # if so, run an extra "redo" to erase the changes
             if cmd_history[0] == 'parinfer_apply':
                 view.run_command('redo')
+
+
+startup_times['plugin_import'] = time.perf_counter() - plugin_import_started_at
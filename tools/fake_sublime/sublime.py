@@ -0,0 +1,738 @@
+"""
+A minimal stand-in for Sublime Text's `sublime` module, so that the plugin can
+be loaded and driven outside of Sublime Text (see tools/latency.py).
+
+Only the parts of the API used by the Parinfer plugin are implemented. Timers
+run on a virtual clock that is advanced explicitly with `run_timers()` or
+`advance()`. Views count how much text the plugin reads and writes in `stats`.
+"""
+
+import bisect
+import heapq
+import itertools
+import json
+import os
+import re
+import tempfile
+import threading
+
+DRAW_EMPTY = 1
+HIDE_ON_MINIMAP = 2
+DRAW_EMPTY_AS_OVERWRITE = 4
+DRAW_NO_FILL = 32
+DRAW_NO_OUTLINE = 256
+DRAW_SOLID_UNDERLINE = 512
+DRAW_STIPPLED_UNDERLINE = 1024
+DRAW_SQUIGGLY_UNDERLINE = 2048
+PERSISTENT = 16
+HIDDEN = 128
+LAYOUT_INLINE = 0
+LAYOUT_BELOW = 1
+LAYOUT_BLOCK = 2
+
+_clock = [0.0]
+_timers = []
+_timer_seq = itertools.count()
+_status_messages = []
+_settings_files = {}
+_windows = []
+_cache_dir = [None]
+# timers can be set from other threads (ie: the engine server reader)
+_timers_lock = threading.Lock()
+
+
+def _reset():
+    _clock[0] = 0.0
+    del _timers[:]
+    del _status_messages[:]
+    _settings_files.clear()
+    del _windows[:]
+
+
+def now_ms():
+    return _clock[0]
+
+
+def set_timeout(fn, delay=0):
+    with _timers_lock:
+        heapq.heappush(_timers, (_clock[0] + delay, next(_timer_seq), fn))
+
+
+set_timeout_async = set_timeout
+
+
+def run_timers(until_ms=None, max_calls=1000000):
+    """Run pending timers in order, advancing the virtual clock."""
+    calls = 0
+    while calls < max_calls:
+        with _timers_lock:
+            if not _timers:
+                break
+            when, _seq, fn = _timers[0]
+            if until_ms is not None and when > until_ms:
+                break
+            heapq.heappop(_timers)
+        _clock[0] = max(_clock[0], when)
+        fn()
+        calls += 1
+    if until_ms is not None:
+        _clock[0] = max(_clock[0], until_ms)
+    return calls
+
+
+def advance(ms):
+    return run_timers(_clock[0] + ms)
+
+
+def status_message(msg):
+    _status_messages.append(msg)
+
+
+def cache_path():
+    if _cache_dir[0] is None:
+        _cache_dir[0] = tempfile.mkdtemp(prefix='fake-sublime-cache-')
+    return _cache_dir[0]
+
+
+def packages_path():
+    return os.path.join(cache_path(), 'Packages')
+
+
+def version():
+    return '4169'
+
+
+def active_window():
+    return _windows[0] if _windows else None
+
+
+def windows():
+    return list(_windows)
+
+
+class Settings(object):
+    def __init__(self, values=None):
+        self._values = dict(values or {})
+
+    def get(self, key, default=None):
+        return self._values.get(key, default)
+
+    def set(self, key, value):
+        self._values[key] = value
+
+    def has(self, key):
+        return key in self._values
+
+    def erase(self, key):
+        self._values.pop(key, None)
+
+    def add_on_change(self, tag, callback):
+        pass
+
+    def clear_on_change(self, tag):
+        pass
+
+
+# directories searched by `load_settings` for package defaults
+settings_search_path = []
+
+
+def _strip_json_comments(text):
+    text = re.sub(r'^\s*//.*$', '', text, flags=re.M)
+    return re.sub(r',(\s*[}\]])', r'\1', text)
+
+
+def load_settings(name):
+    if name not in _settings_files:
+        values = {}
+        for directory in settings_search_path:
+            path = os.path.join(directory, name)
+            if os.path.exists(path):
+                with open(path) as f:
+                    values = json.loads(_strip_json_comments(f.read()))
+                break
+        _settings_files[name] = Settings(values)
+    return _settings_files[name]
+
+
+class Region(object):
+    __slots__ = ('a', 'b', 'xpos')
+
+    def __init__(self, a, b=None, xpos=-1):
+        if b is None:
+            b = a
+        self.a = a
+        self.b = b
+        self.xpos = xpos
+
+    def __repr__(self):
+        return 'Region(%d, %d)' % (self.a, self.b)
+
+    def __len__(self):
+        return self.size()
+
+    def __eq__(self, other):
+        return isinstance(other, Region) and self.a == other.a and self.b == other.b
+
+    def __hash__(self):
+        return hash((self.a, self.b))
+
+    def __iter__(self):
+        return iter((self.a, self.b))
+
+    def __lt__(self, other):
+        return self.begin() < other.begin()
+
+    def __contains__(self, v):
+        if isinstance(v, Region):
+            return v.a in self and v.b in self
+        return self.begin() <= v <= self.end()
+
+    def begin(self):
+        return min(self.a, self.b)
+
+    def end(self):
+        return max(self.a, self.b)
+
+    def size(self):
+        return abs(self.b - self.a)
+
+    def empty(self):
+        return self.a == self.b
+
+    def contains(self, x):
+        return x in self
+
+    def cover(self, other):
+        return Region(min(self.begin(), other.begin()), max(self.end(), other.end()))
+
+    def intersects(self, other):
+        return self.begin() < other.end() and other.begin() < self.end()
+
+    def to_tuple(self):
+        return (self.a, self.b)
+
+
+class Selection(object):
+    def __init__(self, view):
+        self._view = view
+        self._regions = []
+
+    def __len__(self):
+        return len(self._regions)
+
+    def __getitem__(self, i):
+        return self._regions[i]
+
+    def __iter__(self):
+        return iter(list(self._regions))
+
+    def clear(self):
+        self._regions = []
+        self._view._selection_changed()
+
+    def add(self, region):
+        if isinstance(region, int):
+            region = Region(region)
+        self._regions.append(Region(region.a, region.b))
+        self._normalize()
+        self._view._selection_changed()
+
+    def add_all(self, regions):
+        for r in regions:
+            if isinstance(r, int):
+                r = Region(r)
+            elif isinstance(r, tuple):
+                r = Region(*r)
+            self._regions.append(Region(r.a, r.b))
+        self._normalize()
+        self._view._selection_changed()
+
+    def _normalize(self):
+        self._regions.sort(key=lambda r: (r.begin(), r.end()))
+        merged = []
+        for r in self._regions:
+            if merged and r.begin() < merged[-1].end():
+                last = merged[-1]
+                merged[-1] = Region(min(last.begin(), r.begin()), max(last.end(), r.end()))
+            elif merged and r.empty() and merged[-1].empty() and r.a == merged[-1].a:
+                continue
+            else:
+                merged.append(r)
+        self._regions = merged
+
+    def _shift(self, pos, removed, inserted):
+        def move(p):
+            if p < pos:
+                return p
+            if p < pos + removed:
+                return pos + inserted
+            return p - removed + inserted
+        self._regions = [Region(move(r.a), move(r.b)) for r in self._regions]
+
+    def _set_raw(self, regions):
+        self._regions = [Region(r.a, r.b) for r in regions]
+
+
+class Edit(object):
+    def __init__(self, view):
+        self.view = view
+
+
+class HistoricPosition(object):
+    __slots__ = ('pt', 'row', 'col', 'col_utf16', 'col_utf8')
+
+    def __init__(self, pt, row, col):
+        self.pt = pt
+        self.row = row
+        self.col = col
+        self.col_utf16 = col
+        self.col_utf8 = col
+
+
+class TextChange(object):
+    __slots__ = ('a', 'b', 'len_utf16', 'len_utf8', 'str')
+
+    def __init__(self, a, b, text):
+        self.a = a
+        self.b = b
+        self.str = text
+        self.len_utf16 = b.pt - a.pt
+        self.len_utf8 = b.pt - a.pt
+
+
+class Buffer(object):
+    def __init__(self, buffer_id):
+        self.buffer_id = buffer_id
+        self._views = []
+
+    def id(self):
+        return self.buffer_id
+
+    def views(self):
+        return list(self._views)
+
+    def primary_view(self):
+        return self._views[0] if self._views else None
+
+    def file_name(self):
+        v = self.primary_view()
+        return v.file_name() if v else None
+
+
+_view_ids = itertools.count(1)
+
+
+class View(object):
+    """An in-memory buffer + view. Scope information is produced by a tiny
+    built-in Lisp tokenizer when `scopes` is enabled."""
+
+    def __init__(self, text='', file_name=None, window=None, syntax='Packages/Clojure/Clojure.sublime-syntax'):
+        self.view_id = next(_view_ids)
+        self._text = text
+        self._file_name = file_name
+        self._window = window
+        self._sel = Selection(self)
+        self._sel._regions = [Region(0)]
+        self._status = {}
+        self._settings = Settings({'syntax': syntax, 'tab_size': 2, 'translate_tabs_to_spaces': True})
+        self._regions = {}
+        self._change_count = 0
+        self._history = []
+        self._buffer = Buffer(self.view_id)
+        self._buffer._views.append(self)
+        self._viewport = (0, 60)
+        self._in_command = 0
+        self._pending_changes = []
+        self.scopes = True
+        self.stats = {'substr_chars': 0, 'substr_calls': 0, 'written_chars': 0, 'api_calls': 0}
+        if window is not None:
+            window._views.append(self)
+
+    # -- identity --
+    def id(self):
+        return self.view_id
+
+    def buffer_id(self):
+        return self._buffer.buffer_id
+
+    def buffer(self):
+        return self._buffer
+
+    def file_name(self):
+        return self._file_name
+
+    def window(self):
+        return self._window
+
+    def is_valid(self):
+        return True
+
+    def is_loading(self):
+        return False
+
+    def clones(self):
+        return []
+
+    def settings(self):
+        return self._settings
+
+    def change_count(self):
+        return self._change_count
+
+    def size(self):
+        return len(self._text)
+
+    # -- text access --
+    def substr(self, x):
+        self.stats['api_calls'] += 1
+        self.stats['substr_calls'] += 1
+        if isinstance(x, Region):
+            s = self._text[x.begin():x.end()]
+        else:
+            s = self._text[x:x + 1]
+        self.stats['substr_chars'] += len(s)
+        return s
+
+    def rowcol(self, pt):
+        self.stats['api_calls'] += 1
+        pt = max(0, min(pt, len(self._text)))
+        row = self._text.count('\n', 0, pt)
+        col = pt - (self._text.rfind('\n', 0, pt) + 1)
+        return (row, col)
+
+    def text_point(self, row, col):
+        self.stats['api_calls'] += 1
+        if row < 0:
+            return 0
+        start = 0
+        for _ in range(row):
+            i = self._text.find('\n', start)
+            if i == -1:
+                return len(self._text)
+            start = i + 1
+        end = self._text.find('\n', start)
+        if end == -1:
+            end = len(self._text)
+        return min(start + col, end)
+
+    def line(self, x):
+        self.stats['api_calls'] += 1
+        if isinstance(x, Region):
+            a = self.line(x.begin()).begin()
+            b = self.line(x.end()).end()
+            return Region(a, b)
+        pt = max(0, min(x, len(self._text)))
+        start = self._text.rfind('\n', 0, pt) + 1
+        end = self._text.find('\n', pt)
+        if end == -1:
+            end = len(self._text)
+        return Region(start, end)
+
+    def full_line(self, x):
+        r = self.line(x)
+        return Region(r.a, min(r.b + 1, len(self._text)))
+
+    def lines(self, region):
+        out = []
+        pt = region.begin()
+        while True:
+            r = self.line(pt)
+            out.append(r)
+            if r.b >= region.end() or r.b >= len(self._text):
+                break
+            pt = r.b + 1
+        return out
+
+    def sel(self):
+        return self._sel
+
+    def visible_region(self):
+        first, last = self._viewport
+        return Region(self.text_point(first, 0), self.line(self.text_point(last, 0)).b)
+
+    def set_viewport_rows(self, first, last):
+        self._viewport = (first, last)
+
+    def show(self, x, *args, **kwargs):
+        pass
+
+    # -- editing --
+    def _apply(self, pos, removed, text):
+        a_row, a_col = self.rowcol(pos)
+        b_row, b_col = self.rowcol(pos + removed)
+        self._text = self._text[:pos] + text + self._text[pos + removed:]
+        self._change_count += 1
+        self._reset_tokens(pos)
+        self.stats['written_chars'] += len(text)
+        self._sel._shift(pos, removed, len(text))
+        for key, (regions, scope, flags) in list(self._regions.items()):
+            moved = []
+            for r in regions:
+                rr = Selection(self)
+                rr._regions = [r]
+                rr._shift(pos, removed, len(text))
+                moved.append(rr._regions[0])
+            self._regions[key] = (moved, scope, flags)
+        self._pending_changes.append(TextChange(
+            HistoricPosition(pos, a_row, a_col),
+            HistoricPosition(pos + removed, b_row, b_col), text))
+        if not self._in_command:
+            self._flush_modified()
+
+    def _flush_modified(self):
+        changes = self._pending_changes
+        self._pending_changes = []
+        if not changes:
+            return
+        import sublime_plugin
+        sublime_plugin._text_changed(self, changes)
+        sublime_plugin._dispatch('on_modified', self)
+        sublime_plugin._dispatch('on_modified_async', self)
+
+    def _selection_changed(self):
+        if self._in_command:
+            return
+        import sublime_plugin
+        sublime_plugin._dispatch('on_selection_modified', self)
+        sublime_plugin._dispatch('on_selection_modified_async', self)
+
+    def replace(self, edit, region, text):
+        self._apply(region.begin(), region.size(), text)
+
+    def insert(self, edit, pt, text):
+        self._apply(pt, 0, text)
+        return len(text)
+
+    def erase(self, edit, region):
+        self._apply(region.begin(), region.size(), '')
+
+    def run_command(self, cmd, args=None):
+        import sublime_plugin
+        return sublime_plugin._run_text_command(self, cmd, args or {})
+
+    def command_history(self, index, modifying_only=False):
+        i = len(self._history) - 1 + index
+        if 0 <= i < len(self._history):
+            return self._history[i]
+        return (None, None, 0)
+
+    # -- status --
+    def set_status(self, key, value):
+        self._status[key] = value
+
+    def get_status(self, key):
+        return self._status.get(key, '')
+
+    def erase_status(self, key):
+        self._status.pop(key, None)
+
+    # -- regions --
+    def add_regions(self, key, regions, scope='', icon='', flags=0, annotations=None, annotation_color=''):
+        self.stats['api_calls'] += 1
+        self._regions[key] = (list(regions), scope, flags)
+
+    def get_regions(self, key):
+        return list(self._regions.get(key, ([], '', 0))[0])
+
+    def erase_regions(self, key):
+        self.stats['api_calls'] += 1
+        self._regions.pop(key, None)
+
+    # -- syntax --
+    def meta_info(self, key, pt):
+        if key == 'shellVariables':
+            return [{'name': 'TM_COMMENT_START', 'value': '; '}]
+        return None
+
+    def syntax(self):
+        return None
+
+    # The scopes come from a tiny Lisp tokenizer that only runs as far as it
+    # is asked to and starts over from the first change, like a real syntax.
+    # Tokens are (start, end, scope, metas, metas_after) for brackets, strings
+    # and comments, where metas are the meta scopes of the forms around the
+    # token (including the one it opens or closes) and metas_after the ones
+    # after it.
+
+    def _reset_tokens(self, pos=0):
+        tokens = getattr(self, '_token_list', [])
+        keep = bisect.bisect_left([t[1] for t in tokens], pos)
+        self._token_list = tokens[:keep]
+        self._token_starts = [t[0] for t in self._token_list]
+        if self._token_list:
+            last = self._token_list[-1]
+            self._token_pos = last[1]
+            self._token_metas = [m + ' ' for m in last[4].split()]
+        else:
+            self._token_pos = 0
+            self._token_metas = []
+
+    def _tokenize_to(self, pt):
+        if not hasattr(self, '_token_list'):
+            self._reset_tokens()
+        text = self._text
+        n = len(text)
+        i = self._token_pos
+        metas = self._token_metas
+        out = self._token_list
+        while i < n and i <= pt:
+            c = text[i]
+            token = None
+            if c == ';':
+                j = text.find('\n', i)
+                j = n if j == -1 else j
+                token = (i, j, 'comment.line.semicolon.clojure', ''.join(metas), ''.join(metas))
+                i = j
+            elif c == '"':
+                j = i + 1
+                while j < n and text[j] != '"':
+                    j += 2 if text[j] == '\\' else 1
+                token = (i, min(j + 1, n), 'string.quoted.double.clojure', ''.join(metas), ''.join(metas))
+                i = min(j + 1, n)
+            elif c == '\\':
+                i += 2
+            elif c in '([{':
+                kind = {'(': 'parens', '[': 'brackets', '{': 'braces'}[c]
+                metas.append('meta.%s.clojure ' % kind)
+                token = (i, i + 1, 'punctuation.section.%s.begin.clojure' % kind, ''.join(metas), ''.join(metas))
+                i += 1
+            elif c in ')]}':
+                kind = {')': 'parens', ']': 'brackets', '}': 'braces'}[c]
+                inside = ''.join(metas)
+                if metas:
+                    metas.pop()
+                token = (i, i + 1, 'punctuation.section.%s.end.clojure' % kind, inside, ''.join(metas))
+                i += 1
+            else:
+                i += 1
+            if token is not None:
+                out.append(token)
+                self._token_starts.append(token[0])
+        self._token_pos = i
+
+    def _tokens(self):
+        self._tokenize_to(len(self._text))
+        return self._token_list
+
+    def scope_name(self, pt):
+        self.stats['api_calls'] += 1
+        base = 'source.clojure '
+        if not self.scopes:
+            return base
+        self._tokenize_to(pt)
+        i = bisect.bisect_right(self._token_starts, pt) - 1
+        if i < 0:
+            return base
+        a, b, scope, metas, metas_after = self._token_list[i]
+        if pt < b:
+            return base + metas + scope + ' '
+        return base + metas_after
+
+    def find(self, pattern, start_pt, flags=0):
+        self.stats['api_calls'] += 1
+        match = re.compile(pattern, re.M).search(self._text, max(0, start_pt))
+        if match is None:
+            return Region(-1, -1)
+        return Region(match.start(), match.end())
+
+    def match_selector(self, pt, selector):
+        return score_selector(self.scope_name(pt), selector) > 0
+
+    def find_by_selector(self, selector):
+        self.stats['api_calls'] += 1
+        if not self.scopes:
+            return []
+        return [Region(a, b) for a, b, scope, _metas, _after in self._tokens()
+                if score_selector('source.clojure ' + scope, selector) > 0]
+
+    def extract_scope(self, pt):
+        for a, b, scope, _metas, _after in self._tokens():
+            if a <= pt < b:
+                return Region(a, b)
+        return Region(pt, pt)
+
+    def add_phantom(self, *args, **kwargs):
+        return 0
+
+    def erase_phantoms(self, key):
+        pass
+
+
+def score_selector(scope_name, selector):
+    """Very small subset of selector matching: alternatives with `,`,
+    subtraction with ` - `, and space-separated descendant parts."""
+    scopes = scope_name.split()
+    for alt in selector.split(','):
+        parts = [p.strip() for p in alt.split(' - ')]
+        include = parts[0]
+        excludes = parts[1:]
+
+        def matches(sel):
+            for atom in sel.split():
+                if not any(s == atom or s.startswith(atom + '.') for s in scopes):
+                    return False
+            return True
+
+        if include and matches(include) and not any(matches(e) for e in excludes if e):
+            return 1
+    return 0
+
+
+class Phantom(object):
+    def __init__(self, region, content, layout, on_navigate=None):
+        self.region = region
+        self.content = content
+        self.layout = layout
+        self.on_navigate = on_navigate
+
+
+class PhantomSet(object):
+    def __init__(self, view, key=''):
+        self.view = view
+        self.key = key
+        self.phantoms = []
+
+    def update(self, phantoms):
+        self.phantoms = list(phantoms)
+
+
+class Window(object):
+    def __init__(self):
+        self._views = []
+        self._panels = {}
+        self._active = None
+        _windows.append(self)
+
+    def id(self):
+        return 1
+
+    def views(self):
+        return list(self._views)
+
+    def active_view(self):
+        return self._active or (self._views[0] if self._views else None)
+
+    def focus_view(self, view):
+        self._active = view
+        import sublime_plugin
+        sublime_plugin._dispatch('on_activated', view)
+        sublime_plugin._dispatch('on_activated_async', view)
+
+    def num_groups(self):
+        return 1
+
+    def active_view_in_group(self, group):
+        return self.active_view()
+
+    def create_output_panel(self, name, unlisted=False):
+        v = View('', window=None)
+        self._panels[name] = v
+        return v
+
+    def find_output_panel(self, name):
+        return self._panels.get(name)
+
+    def run_command(self, cmd, args=None):
+        import sublime_plugin
+        return sublime_plugin._run_window_command(self, cmd, args or {})
@@ -0,0 +1,225 @@
+"""
+A minimal stand-in for Sublime Text's `sublime_plugin` module: command and
+event-listener base classes plus a registry that `load_plugin()` fills in.
+"""
+
+import importlib.util
+import os
+import re
+import sys
+
+import sublime
+
+_text_commands = {}
+_window_commands = {}
+_application_commands = {}
+_listeners = []
+_text_change_listener_classes = []
+_text_change_listeners = {}
+_command_instances = {}
+
+
+def _reset():
+    _text_commands.clear()
+    _window_commands.clear()
+    _application_commands.clear()
+    del _listeners[:]
+    del _text_change_listener_classes[:]
+    _text_change_listeners.clear()
+    _command_instances.clear()
+
+
+def command_name(cls_name):
+    name = cls_name
+    if name.endswith('Command'):
+        name = name[:-len('Command')]
+    name = re.sub(r'([A-Z]+)([A-Z][a-z])', r'\1_\2', name)
+    name = re.sub(r'([a-z\d])([A-Z])', r'\1_\2', name)
+    return name.lower()
+
+
+class Command(object):
+    def is_enabled(self, *args, **kwargs):
+        return True
+
+    def is_visible(self, *args, **kwargs):
+        return True
+
+
+class TextCommand(Command):
+    def __init__(self, view):
+        self.view = view
+
+
+class WindowCommand(Command):
+    def __init__(self, window):
+        self.window = window
+
+
+class ApplicationCommand(Command):
+    pass
+
+
+class EventListener(object):
+    pass
+
+
+class ViewEventListener(object):
+    def __init__(self, view):
+        self.view = view
+
+
+class TextChangeListener(object):
+    def __init__(self):
+        self.buffer = None
+
+    @classmethod
+    def is_applicable(cls, buffer):
+        return True
+
+    def attach(self, buffer):
+        self.buffer = buffer
+
+    def detach(self):
+        self.buffer = None
+
+    def is_attached(self):
+        return self.buffer is not None
+
+
+def load_plugin(path, name='plugin_under_test'):
+    """Import a plugin file and register its commands and listeners."""
+    directory = os.path.dirname(os.path.abspath(path))
+    if directory not in sys.path:
+        sys.path.insert(0, directory)
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    for attr in dir(module):
+        obj = getattr(module, attr)
+        if not isinstance(obj, type) or obj.__module__ != module.__name__:
+            continue
+        if issubclass(obj, TextCommand):
+            _text_commands[command_name(obj.__name__)] = obj
+        elif issubclass(obj, WindowCommand):
+            _window_commands[command_name(obj.__name__)] = obj
+        elif issubclass(obj, ApplicationCommand):
+            _application_commands[command_name(obj.__name__)] = obj
+        elif issubclass(obj, EventListener):
+            _listeners.append(obj())
+        elif issubclass(obj, TextChangeListener):
+            _text_change_listener_classes.append(obj)
+    if hasattr(module, 'plugin_loaded'):
+        module.plugin_loaded()
+    return module
+
+
+def _dispatch(event, *args):
+    result = None
+    for listener in _listeners:
+        fn = getattr(listener, event, None)
+        if fn is not None:
+            r = fn(*args)
+            if r is not None and result is None:
+                result = r
+    return result
+
+
+def _text_changed(view, changes):
+    buffer = view.buffer()
+    key = buffer.id()
+    if key not in _text_change_listeners:
+        listeners = []
+        for cls in _text_change_listener_classes:
+            if cls.is_applicable(buffer):
+                inst = cls()
+                inst.attach(buffer)
+                listeners.append(inst)
+        _text_change_listeners[key] = listeners
+    for inst in _text_change_listeners[key]:
+        if hasattr(inst, 'on_text_changed'):
+            inst.on_text_changed(changes)
+        if hasattr(inst, 'on_text_changed_async'):
+            inst.on_text_changed_async(changes)
+
+
+def _builtin_text_command(view, cmd, args):
+    edit = sublime.Edit(view)
+    if cmd == 'insert':
+        for r in reversed(list(view.sel())):
+            view.replace(edit, r, args.get('characters', ''))
+        return True
+    if cmd in ('indent', 'unindent'):
+        tab = ' ' * view.settings().get('tab_size', 2)
+        rows = set()
+        for r in view.sel():
+            a, _ = view.rowcol(r.begin())
+            b, _ = view.rowcol(r.end())
+            rows.update(range(a, b + 1))
+        for row in sorted(rows, reverse=True):
+            pt = view.text_point(row, 0)
+            if cmd == 'indent':
+                view.insert(edit, pt, tab)
+            else:
+                line = view.substr(view.line(pt))
+                n = min(len(tab), len(line) - len(line.lstrip(' ')))
+                view.erase(edit, sublime.Region(pt, pt + n))
+        return True
+    if cmd == 'left_delete':
+        for r in reversed(list(view.sel())):
+            if r.empty():
+                r = sublime.Region(max(0, r.a - 1), r.a)
+            view.erase(edit, r)
+        return True
+    if cmd == 'paste':
+        text = args.get('text', '')
+        for r in reversed(list(view.sel())):
+            view.replace(edit, r, text)
+        return True
+    if cmd in ('undo', 'redo', 'move', 'append'):
+        if cmd == 'append':
+            view.insert(edit, view.size(), args.get('characters', ''))
+        return True
+    return False
+
+
+def _run_text_command(view, cmd, args):
+    rewritten = _dispatch('on_text_command', view, cmd, args)
+    if rewritten:
+        cmd, args = rewritten[0], rewritten[1] or {}
+    cls = _text_commands.get(cmd)
+    view._in_command += 1
+    before = view.change_count()
+    sel_before = [r.to_tuple() for r in view.sel()]
+    try:
+        if cls is None:
+            handled = _builtin_text_command(view, cmd, args)
+            if not handled:
+                raise KeyError('unknown text command: ' + cmd)
+        else:
+            key = (view.id(), cmd)
+            if key not in _command_instances:
+                _command_instances[key] = cls(view)
+            inst = _command_instances[key]
+            inst.run(sublime.Edit(view), **args)
+    finally:
+        view._in_command -= 1
+    if view.change_count() != before:
+        view._history.append((cmd, args, 1))
+    if not view._in_command:
+        view._flush_modified()
+        if [r.to_tuple() for r in view.sel()] != sel_before:
+            _dispatch('on_selection_modified', view)
+    _dispatch('on_post_text_command', view, cmd, args)
+    return None
+
+
+def _run_window_command(window, cmd, args):
+    cls = _window_commands.get(cmd)
+    if cls is None:
+        cls = _application_commands.get(cmd)
+        if cls is None:
+            return None
+        return cls().run(**args)
+    return cls(window).run(**args)
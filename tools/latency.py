@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Measures keystroke-to-apply latency of the Parinfer plugin without Sublime
+Text, using the stand-in `sublime` and `sublime_plugin` modules in
+tools/fake_sublime.
+
+Each simulated keystroke types into the buffer, fires the plugin's event
+listeners and runs its timers (the debounce, the inspect command and the apply
+command) on the virtual clock. The wall time of that is the latency of one
+keystroke; the views also count how much text the plugin read and wrote.
+
+Examples:
+
+    python3 tools/latency.py
+    python3 tools/latency.py --forms 2000 --keystrokes 500
+    python3 tools/latency.py --huge-form 20000
+    python3 tools/latency.py --file path/to/core.clj --line 120
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+PACKAGE_DIR = os.path.dirname(TOOLS_DIR)
+sys.path.insert(0, os.path.join(TOOLS_DIR, 'fake_sublime'))
+
+import sublime
+import sublime_plugin
+
+# enough virtual time for the debounce and the apply command to run
+KEYSTROKE_MS = 100
+
+
+def generated_forms(count):
+    forms = []
+    for i in range(count):
+        forms.append('(defn fn-%d [a b]\n'
+                     '  (let [x (inc a)\n'
+                     '        y {:a [1 2 3] :b "str (%d"}]\n'
+                     '    (when (pos? x)\n'
+                     '      (+ x y b))))\n' % (i, i))
+    return '\n'.join(forms)
+
+
+def huge_form(lines):
+    items = ['   {:id %d :name "item %d" :tags [:a :b]}' % (i, i) for i in range(lines)]
+    return '(def data\n  [' + '\n'.join(items)[3:] + '])\n'
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100.0))]
+
+
+def load_plugin(settings):
+    sublime.settings_search_path.append(PACKAGE_DIR)
+    for key, value in settings.items():
+        sublime.load_settings('Parinfer.sublime-settings').set(key, value)
+    return sublime_plugin.load_plugin(os.path.join(PACKAGE_DIR, 'sublime-parinfer.py'),
+                                      name='parinfer_plugin')
+
+
+def run(text, file_name, cursor_line, keystrokes, seed):
+    window = sublime.Window()
+    view = sublime.View(text, file_name=file_name, window=window)
+    window.focus_view(view)
+    view.set_status('parinfer', 'Parinfer: Indent')
+
+    row = min(cursor_line, view.rowcol(view.size())[0])
+    point = view.line(view.text_point(row, 0)).end()
+    view.sel().clear()
+    view.sel().add(sublime.Region(point))
+    sublime.run_timers()
+
+    rng = random.Random(seed)
+    for key in view.stats:
+        view.stats[key] = 0
+
+    latencies = []
+    for _ in range(keystrokes):
+        # mostly typing, sometimes a new line or a backspace
+        roll = rng.random()
+        started_at = time.perf_counter()
+        if roll < 0.1:
+            sublime_plugin._run_text_command(view, 'insert', {'characters': '\n  '})
+        elif roll < 0.3:
+            sublime_plugin._run_text_command(view, 'left_delete', {})
+        else:
+            sublime_plugin._run_text_command(view, 'insert', {'characters': rng.choice('abc (x) [y] ')})
+        sublime.advance(KEYSTROKE_MS)
+        latencies.append(time.perf_counter() - started_at)
+
+    return latencies, view.stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n\n')[0])
+    parser.add_argument('--forms', type=int, default=500,
+                        help='number of generated top-level forms (default: 500)')
+    parser.add_argument('--huge-form', type=int, metavar='LINES',
+                        help='use one generated top-level form with this many lines instead')
+    parser.add_argument('--file', help='use this file instead of generated code')
+    parser.add_argument('--line', type=int, help='line to type on (default: the middle)')
+    parser.add_argument('--keystrokes', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--validate', action='store_true',
+                        help='keep idle whole-buffer validation on')
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file) as f:
+            text = f.read()
+        file_name = os.path.abspath(args.file)
+    elif args.huge_form:
+        text = huge_form(args.huge_form)
+        file_name = '/tmp/latency.clj'
+    else:
+        text = generated_forms(args.forms)
+        file_name = '/tmp/latency.clj'
+
+    cursor_line = args.line
+    if cursor_line is None:
+        cursor_line = text.count('\n') // 2
+
+    settings = {}
+    if not args.validate:
+        settings['validate_when_idle_ms'] = 0
+    plugin = load_plugin(settings)
+
+    latencies, stats = run(text, file_name, cursor_line, args.keystrokes, args.seed)
+
+    n = len(latencies)
+    print('buffer: %d lines, %d chars; %d keystrokes on line %d' % (
+        text.count('\n') + 1, len(text), n, cursor_line + 1))
+    print('latency ms: p50 %.2f  p90 %.2f  p99 %.2f  max %.2f' % tuple(
+        percentile(latencies, p) * 1000 for p in (50, 90, 99, 100)))
+    print('per keystroke: %.0f chars read in %.1f substr calls, %.0f chars written, %.1f API calls' % (
+        stats['substr_chars'] / float(n), stats['substr_calls'] / float(n),
+        stats['written_chars'] / float(n), stats['api_calls'] / float(n)))
+    cache = plugin.result_cache
+    print('result cache: %d hits, %d misses' % (cache.hits, cache.misses))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Replays an editing session recorded with "Parinfer: Start Recording Session"
+against the plugin (using the stand-in sublime modules in tools/fake_sublime)
+and reports how long each event took.
+
+The user's edits and selections are fed to the plugin at their recorded times
+on a virtual clock, so the debounce behaves as it did while recording, and the
+plugin makes its own changes. Pass another parinfer.py with --engine to compare
+engine strategies on the same session.
+
+Examples:
+
+    python3 tools/replay.py session-20240101-120000.jsonl
+    python3 tools/replay.py session.jsonl --engine ../other/parinfer.py
+    python3 tools/replay.py session.jsonl --events
+"""
+
+import argparse
+import hashlib
+import importlib.util
+import json
+import time
+
+from latency import load_plugin, percentile
+
+import sublime
+import sublime_plugin
+
+EVENT_NAMES = {
+    'c': 'edit',
+    's': 'selection',
+}
+
+
+def read_events(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def load_engine(path):
+    spec = importlib.util.spec_from_file_location('parinfer_under_test', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def summary(values):
+    if not values:
+        return 'none'
+    return 'n %d  p50 %.2f  p90 %.2f  max %.2f' % (
+        len(values), percentile(values, 50), percentile(values, 90), max(values))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n\n')[0])
+    parser.add_argument('session', help='a session-*.jsonl file')
+    parser.add_argument('--engine', help='path of a parinfer.py (with the same API) to replay with')
+    parser.add_argument('--events', action='store_true', help='print one line per event')
+    args = parser.parse_args()
+
+    events = read_events(args.session)
+
+    # the idle check of the whole file is not part of the edits we time
+    settings = {'validate_when_idle_ms': 0}
+    engine = None
+    if args.engine:
+        engine = load_engine(args.engine)
+        # bounded mode reads the form with the engine's Checker, which older
+        # engines do not have
+        if not hasattr(engine, 'Checker'):
+            settings['bounded_mode_max_lines'] = 0
+    plugin = load_plugin(settings)
+    if engine is not None:
+        plugin.engine = engine
+
+    # time every engine run the plugin makes, where the recorder timed them
+    engine_ms = []
+    run_engine = plugin.run_engine
+    def timed_run_engine(*run_args):
+        started_at = time.perf_counter()
+        result = run_engine(*run_args)
+        engine_ms.append((time.perf_counter() - started_at) * 1000)
+        return result
+    plugin.run_engine = timed_run_engine
+
+    window = sublime.Window()
+    views = {}
+    final_hashes = {}
+    recorded_engine_ms = []
+    recorded_levels = []
+    latencies = {}
+
+    for i, event in enumerate(events):
+        event_type, t, view_id = event[0], event[1], event[2]
+        view = views.get(view_id)
+        runs_before = len(engine_ms)
+        started_at = time.perf_counter()
+
+        if event_type == 'v':
+            file_name, status, text = event[3:6]
+            view = views[view_id] = sublime.View(text, file_name=file_name, window=window)
+            view.set_status(plugin.STATUS_KEY, status)
+            window.focus_view(view)
+        elif event_type == 'c':
+            a, b, text = event[3:6]
+            view.replace(sublime.Edit(view), sublime.Region(a, b), text)
+        elif event_type == 's':
+            view.sel()._set_raw([sublime.Region(a, b) for a, b in event[3]])
+            sublime_plugin._dispatch('on_selection_modified', view)
+        elif event_type == 'm':
+            view.set_status(plugin.STATUS_KEY, event[3])
+        elif event_type == 'r':
+            recorded_engine_ms.append(event[4])
+        elif event_type == 'l':
+            recorded_levels.append(event[3])
+        elif event_type == 'e':
+            final_hashes[view_id] = event[3]
+        # 'p' events are the plugin's own changes, which it makes again here
+
+        # run what the event scheduled up to the next event
+        next_t = events[i + 1][1] if i + 1 < len(events) else None
+        sublime.run_timers(until_ms=next_t)
+
+        wall_ms = (time.perf_counter() - started_at) * 1000
+        run_ms = sum(engine_ms[runs_before:])
+        if event_type in EVENT_NAMES:
+            latencies.setdefault(EVENT_NAMES[event_type], []).append(wall_ms)
+        if args.events:
+            print('%6d %10.1f %s %8.2f ms  engine %8.2f ms in %d runs' % (
+                i, t, event_type, wall_ms, run_ms, len(engine_ms) - runs_before))
+
+    print('%d events, %d views' % (len(events), len(views)))
+    for name in sorted(latencies):
+        print('%-10s ms: %s' % (name, summary(latencies[name])))
+    print('engine ms, recorded: %s' % summary(recorded_engine_ms))
+    print('engine ms, replayed: %s' % summary(engine_ms))
+    if recorded_levels:
+        print('latency levels, recorded: %s' % ' '.join(map(str, recorded_levels)))
+
+    for view_id, expected in sorted(final_hashes.items()):
+        view = views[view_id]
+        text = view.substr(sublime.Region(0, view.size()))
+        same = hashlib.sha1(text.encode('utf-8')).hexdigest() == expected
+        print('view %d (%s): final text %s the recording' % (
+            view_id, view.file_name(), 'matches' if same else 'DIFFERS from'))
+
+
+if __name__ == '__main__':
+    main()